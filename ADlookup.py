@@ -1,14 +1,30 @@
-from ldap3 import Server, Connection, ALL, NTLM, Tls
+from ldap3 import Server, Connection, ALL, Tls
+from ldap3.core.exceptions import LDAPException, LDAPCommunicationError
+from ldap3.utils.conv import escape_filter_chars
+from concurrent.futures import ThreadPoolExecutor
 import ssl,sys
 import config
 import functools
 import json
+import queue
+import atexit
+import threading
+import base64
+import contextlib
+from identitycache import IdentityCache
+from photocache import PhotoCache
+
+USER_ATTRIBUTES = ['givenName', 'sn',  'samaccountname', 'displayName', 'mail' ]
+MAIL_ATTRIBUTES = ['givenName', 'sn',  'samaccountname', 'displayName' ]
 
 class AD:
 
-    def __init__(self, region = 'EAME'):
-        '''  Region not used in setting base as using port 3268 gives global catalog '''
+    def __init__(self, region = 'EAME', offline=False, cache=None):
+        '''  Region not used in setting base as using port 3268 gives global catalog
+             offline: only answer from the identity cache, don't ask the directory '''
         self.region = region
+        self.offline = offline
+        self.cache = cache if cache is not None else IdentityCache(ttl=ldap_cache_ttl, negative_ttl=ldap_negative_ttl)
         AD.set_base(self, self.region)
 
     def set_base(self, region):
@@ -20,31 +36,237 @@ class AD:
 
     @functools.lru_cache(maxsize=128, typed=False)
     def fetch(self, search_filter, attributes):
-        with Connection(server, ldap_user, ldap_pass) as conn:
-            conn.search(self.search_base, search_filter, search_scope='SUBTREE', attributes=attributes)
-            entry = conn.entries[0].entry_to_json()
+        entries = get_pool().search(self.search_base, search_filter, search_scope='SUBTREE', attributes=attributes)
+        entry = entries[0].entry_to_json()
+
+        return(entry)
+
+    def cached(self, kind, key, search):
+        ''' Entry for key from the identity cache, else search() and remember it
+            User Not Found (IndexError) is remembered too '''
+        hit, entry = self.cache.get(kind, key, stale=self.offline)
+        if not hit and not self.offline:
+            try:
+                entry = search()
+            except IndexError:
+                entry = None
+            self.cache.put(kind, key, entry)
+        if entry is None:
+            raise IndexError(f'{key} not found')
+        return entry
+
+    def fetch_many(self, attribute, values, attributes, batch_size=None, raw=False):
+        ''' Search for many values of attribute at once, OR'ed together
+            batch_size to a filter: (|(sAMAccountName=a)(sAMAccountName=b)...)
+            Return dict of value (lower case, AD doesn't mind) -> entry JSON,
+            or with raw the entry's attributes dict (bytes left as bytes) '''
+        batch_size = batch_size or ldap_batch_size
+        values = list(dict.fromkeys(values))
+        batches = [values[start:start + batch_size] for start in range(0, len(values), batch_size)]
 
-            return(entry)
+        def search(batch):
+            terms = ''.join(f'({attribute}={escape_filter_chars(str(value))})' for value in batch)
+            return get_pool().search(self.search_base, f'(|{terms})', search_scope='SUBTREE', attributes=[attribute, *attributes])
+
+        found = {}
+        # A batch per pooled connection at a time
+        with ThreadPoolExecutor(max_workers=max(min(ldap_pool_size, len(batches)), 1)) as workers:
+            for entries in workers.map(search, batches):
+                for entry in entries:
+                    key = str(entry[attribute].value).lower()
+                    found[key] = entry.entry_attributes_as_dict if raw else entry.entry_to_json()
+        return found
+
+    def users(self, usernames, batch_size=None):
+        ''' user() for many usernames, from the identity cache and then batched
+            searches for the rest. Return dict of lower case username -> entry JSON
+            for those found '''
+        found = self.cache.get_many('user', usernames, stale=self.offline)
+        missing = list(dict.fromkeys(str(name).lower() for name in usernames if str(name).lower() not in found))
+        if missing and not self.offline:
+            fetched = AD.fetch_many(self, 'sAMAccountName', missing, USER_ATTRIBUTES, batch_size)
+            # Remember who wasn't there as well
+            fetched = {name: fetched.get(name) for name in missing}
+            self.cache.put_many('user', fetched)
+            found.update(fetched)
+        return {name: entry for name, entry in found.items() if entry is not None}
+
+    def display_names(self, usernames, batch_size=None):
+        ''' Return dict of username -> displayName for the usernames found '''
+        found = AD.users(self, usernames, batch_size)
+        names = {}
+        for username in usernames:
+            entry = found.get(str(username).lower())
+            if entry:
+                display_name = json.loads(entry)['attributes'].get('displayName')
+                if display_name:
+                    names[username] = display_name[0]
+        return names
 
     def user(self, username):
-        search_filter = f'(sAMAccountName={username})'
-        attributes = ['givenName', 'sn',  'samaccountname', 'displayName', 'mail' ]
-        return AD.fetch(self, search_filter, attributes)
+        search_filter = f'(sAMAccountName={escape_filter_chars(str(username))})'
+        return AD.cached(self, 'user', username, lambda: AD.fetch(self, search_filter, tuple(USER_ATTRIBUTES)))
 
     def thumbnail(self, username):
-        search_filter = f'(sAMAccountName={username})'
-        attributes = ['thumbnailPhoto']
+        search_filter = f'(sAMAccountName={escape_filter_chars(str(username))})'
+        attributes = ('thumbnailPhoto',)
         return AD.fetch(self, search_filter, attributes)
 
+    def prefetch_thumbnails(self, usernames, photos=None, batch_size=None):
+        ''' Make sure the photos of usernames (e.g. events.User.unique()) are on disk
+            Users we know are answered from the identity cache without asking AD.
+            Expired ones are checked with a whenChanged only search, like an ETag,
+            and only new or changed photos are fetched, in batched searches
+            Return dict of username -> photo file, for users with a photo '''
+        photos = photos or PhotoCache()
+        wanted = list(dict.fromkeys(str(name).lower() for name in usernames))
+
+        def usable(found):
+            ''' Decoded photo entries, dropping those whose file has gone '''
+            found = {name: entry and json.loads(entry) for name, entry in found.items()}
+            return {name: entry for name, entry in found.items()
+                    if entry is None or entry['sha256'] is None or photos.has(entry['sha256'])}
+
+        known = usable(self.cache.get_many('photo', wanted, stale=self.offline))
+        missing = [name for name in wanted if name not in known]
+
+        if missing and not self.offline:
+            # Expired: has the user changed since?
+            stale = usable(self.cache.get_many('photo', missing, stale=True))
+            stale = {name: entry for name, entry in stale.items() if entry is not None}
+            if stale:
+                changed = AD.fetch_many(self, 'sAMAccountName', list(stale), ['whenChanged'], batch_size, raw=True)
+                same = {name: entry for name, entry in stale.items()
+                        if name in changed and str(changed[name].get('whenChanged', [''])[0]) == entry['changed']}
+                self.cache.put_many('photo', {name: json.dumps(entry) for name, entry in same.items()})
+                known.update(same)
+                missing = [name for name in missing if name not in same]
+
+        if missing and not self.offline:
+            fetched = AD.fetch_many(self, 'sAMAccountName', missing, ['thumbnailPhoto', 'whenChanged'], batch_size, raw=True)
+            entries = {}
+            for name in missing:
+                attributes = fetched.get(name)
+                if attributes is None:
+                    # User Not Found
+                    entries[name] = None
+                    continue
+                photo = (attributes.get('thumbnailPhoto') or [None])[0]
+                entries[name] = {
+                    'sha256': photos.store(photo) if photo else None,
+                    'changed': str((attributes.get('whenChanged') or [''])[0]),
+                }
+            self.cache.put_many('photo', {name: entry and json.dumps(entry) for name, entry in entries.items()})
+            known.update(entries)
+
+        files = {}
+        for username in usernames:
+            entry = known.get(str(username).lower())
+            if entry is not None and entry['sha256'] is not None:
+                files[username] = photos.path(entry['sha256'])
+        return files
+
     def user_from_mail(self, mail):
-        search_filter = f'(mail={mail})'
-        attributes = ['givenName', 'sn',  'samaccountname', 'displayName' ]
-        return AD.fetch(self, search_filter, attributes)
+        search_filter = f'(mail={escape_filter_chars(str(mail))})'
+        return AD.cached(self, 'mail', mail, lambda: AD.fetch(self, search_filter, tuple(MAIL_ATTRIBUTES)))
 
     def extract_thumbnail(self, username):
-        image  = AD.thumbnail(self, username)
-        lookup = json.loads(image)
-        return (lookup["attributes"]["thumbnailPhoto"][0]["encoded"])
+        ''' base64 of username's photo, from the photo cache when we have it '''
+        photo = AD.prefetch_thumbnails(self, [username]).get(username)
+        if photo is None:
+            raise IndexError(f'No photo for {username}')
+        with open(photo, 'rb') as f:
+            return base64.b64encode(f.read()).decode('ascii')
+
+
+class ConnectionPool:
+    ''' Bounded pool of bound connections, shared by every AD and safe to use
+        from a thread pool. Connections are made on first use, checked before
+        they are handed out and replaced when the directory has dropped them '''
+
+    def __init__(self, size):
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def connect(self):
+        return Connection(get_server(), ldap_user, ldap_pass, auto_bind=True, receive_timeout=ldap_timeout)
+
+    @contextlib.contextmanager
+    def connection(self, fresh=False):
+        ''' Lend a healthy connection, waiting while all size are in use
+            fresh: a new one, not one of the idle ones '''
+        with self.slots:
+            conn = None
+            if not fresh:
+                try:
+                    conn = self.idle.get_nowait()
+                except queue.Empty:
+                    pass
+            if conn is None or conn.closed or not conn.bound:
+                # Never made, or the server has hung up on it
+                self.discard(conn)
+                conn = self.connect()
+            try:
+                yield conn
+            except BaseException:
+                # Don't lend out a connection in an unknown state
+                self.discard(conn)
+                raise
+            self.idle.put(conn)
+
+    def search(self, *args, **kwargs):
+        ''' conn.search() on a pooled connection, again on a fresh one if the
+            connection had gone stale. Return the entries found '''
+        try:
+            with self.connection() as conn:
+                conn.search(*args, **kwargs)
+                return list(conn.entries)
+        except LDAPCommunicationError:
+            # The idle ones may have been dropped too, closed and bound only
+            # say what we know of them, not the server
+            with self.connection(fresh=True) as conn:
+                conn.search(*args, **kwargs)
+                return list(conn.entries)
+
+    def discard(self, conn):
+        if conn is not None:
+            try:
+                conn.unbind()
+            except LDAPException:
+                pass
+
+    def close(self):
+        ''' Unbind every idle connection '''
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+_lock = threading.Lock()
+_server = None
+_pool = None
+
+
+def get_server():
+    ''' The Server, made on first use rather than on import '''
+    global _server
+    with _lock:
+        if _server is None:
+            _server = Server(ldap_server, port=ldap_port,  use_ssl=False, get_info=ALL)
+        return _server
+
+
+def get_pool():
+    ''' The ConnectionPool every AD shares, made on first use '''
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ConnectionPool(ldap_pool_size)
+            atexit.register(_pool.close)
+        return _pool
 
 
 ldap_server = config.ldap_server
@@ -52,9 +274,15 @@ ldap_port = config.ldap_port
 ldap_user = config.ldap_user
 ldap_pass = config.ldap_pass
 ldap_base = config.ldap_base
-server = Server(ldap_server, port=ldap_port,  use_ssl=False, get_info=ALL)
+# Users looked up per LDAP search by fetch_many
+ldap_batch_size = getattr(config, 'ldap_batch_size', 100)
+# Seconds the identity cache keeps users found and not found
+ldap_cache_ttl = getattr(config, 'ldap_cache_ttl', 7 * 24 * 3600)
+ldap_negative_ttl = getattr(config, 'ldap_negative_ttl', 24 * 3600)
+# Bound connections kept open, and seconds to wait for an answer
+ldap_pool_size = getattr(config, 'ldap_pool_size', 4)
+ldap_timeout = getattr(config, 'ldap_timeout', 30)
 tls_configuration = Tls(validate=ssl.CERT_REQUIRED, version=ssl.PROTOCOL_TLSv1)
-conn = Connection(server, ldap_user, ldap_pass, authentication=NTLM, auto_bind=True, client_strategy='REUSABLE')
 context=ssl.create_default_context()
 
 
@@ -4,4 +4,9 @@ ldap_port = 3268
 ldap_base = "dc=company,dc=com"
 ldap_user = "DOAMIN\userid" # service account
 ldap_pass = "super_secure_plaintext_password" #your service users password
+ldap_batch_size = 100 # users looked up per LDAP search with -a
+ldap_cache_ttl = 7 * 24 * 3600 # seconds users found are cached for
+ldap_negative_ttl = 24 * 3600 # seconds users not found are cached for
+ldap_pool_size = 4 # bound connections kept open to the directory
+ldap_timeout = 30 # seconds to wait for the directory to answer
  
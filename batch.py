@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Many reports from one parse: --every 1M cuts the range into calendar
+   windows. The log is parsed and paired once, each window gets the
+   sessions overlapping it clipped to its edges, the refusals inside it
+   and the report runs on those in a worker process, Agg backend, with
+   its files and printout in a directory named for the window"""
+import os
+import re
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+import concurrency
+
+# --every units and the calendar frequency each steps by
+FREQUENCIES = {"H": "h", "D": "D", "W": "W-MON", "M": "MS", "Y": "YS"}
+# Window directory names
+LABELS = {
+    "H": "%Y-%m-%dT%H",
+    "D": "%Y-%m-%d",
+    "W": "%Y-%m-%d",
+    "M": "%Y-%m",
+    "Y": "%Y",
+}
+
+
+def windows(every, first, last):
+    """Cut first to last into calendar windows of every: Hours, Days,
+    Weeks, Months or Years, e.g. 1M or 2W. Windows are whole periods,
+    the first holds first and the last holds the time up to last: an end
+    on a period boundary doesn't start another
+    Return list of (label, start, end), end exclusive"""
+    fields = re.fullmatch(r"(\d+)([HDWMY])", str(every).strip().upper())
+    if not fields or int(fields[1]) < 1:
+        raise ValueError(f"--every {every} isn't Hours, Days, Weeks, Months or Years")
+    count, unit = int(fields[1]), fields[2]
+    offset = to_offset(f"{count}{FREQUENCIES[unit]}")
+    first, last = pd.Timestamp(first), pd.Timestamp(last)
+    start = first.floor("h") if unit == "H" else first.normalize()
+    start = offset.rollback(start)
+    edges = pd.date_range(start, last, freq=offset)
+    if edges[-1] < last or len(edges) == 1:
+        edges = edges.append(pd.DatetimeIndex([edges[-1] + offset]))
+    return [
+        (begin.strftime(LABELS[unit]), begin, end)
+        for begin, end in zip(edges[:-1], edges[1:])
+    ]
+
+
+def span(events, start=None, end=None):
+    """First checkout and last checkin of events, within start and end
+    (YYYY-MM-DDTHH:MM) when given"""
+    if events.empty:
+        raise ValueError("No sessions to report on")
+    first = pd.Timestamp(concurrency.as_datetimes(events["LicOut"]).min())
+    last = pd.Timestamp(concurrency.as_datetimes(events["LicIn"]).max())
+    if start:
+        first = max(first, pd.Timestamp(start))
+    if end:
+        last = min(last, pd.Timestamp(end))
+    return first, last
+
+
+def bound(when, column):
+    """when in the time zone of column, so they compare"""
+    when = pd.Timestamp(when)
+    tz = column.dt.tz
+    return when.tz_localize(tz) if tz is not None and when.tzinfo is None else when
+
+
+def clip_events(events, start, end):
+    """Sessions of events open between start and end, LicOut and LicIn
+    cut to those edges and Duration what is left"""
+    start, end = bound(start, events["LicOut"]), bound(end, events["LicOut"])
+    window = events[(events["LicOut"] < end) & (events["LicIn"] > start)].copy()
+    window["LicOut"] = window["LicOut"].clip(lower=start)
+    window["LicIn"] = window["LicIn"].clip(upper=end)
+    window["Duration"] = window["LicIn"] - window["LicOut"]
+    return window
+
+
+def clip_rows(frame, start, end, column="Date"):
+    """Rows of frame with column from start up to end"""
+    when = frame[column]
+    start, end = bound(start, when), bound(end, when)
+    return frame[(when >= start) & (when < end)]
+
+
+def clip_series(steps, start, end):
+    """Step series (e.g. loans) from start up to end, starting with the
+    level it was at when the window opened"""
+    index = steps.index
+    window = steps[(index >= start) & (index < end)]
+    before = steps[index < start]
+    if len(before):
+        opening = pd.Series([before.iloc[-1]], index=pd.DatetimeIndex([start]))
+        window = pd.concat([opening.rename(steps.name), window])
+    return window
+
+
+def use_agg():
+    """Draw to files, there is nobody to show a window to"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def run_report(directory, report, args, kwargs):
+    """report(*args, **kwargs) with its files and printout in directory"""
+    os.makedirs(directory, exist_ok=True)
+    cwd = os.getcwd()
+    with open(os.path.join(directory, "report.txt"), "w", encoding="utf8") as out:
+        try:
+            os.chdir(directory)
+            with contextlib.redirect_stdout(out):
+                report(*args, **kwargs)
+        finally:
+            os.chdir(cwd)
+    return directory
+
+
+def write_reports(report, cuts, events, denied, loans=None, jobs=None, **kwargs):
+    """Run report(events, denied, **kwargs) for each (label, start, end)
+    of cuts on the sessions and refusals of that window, in jobs worker
+    processes. loans: step series to clip and pass on as loans="""
+    tasks = []
+    for label, start, end in cuts:
+        window = clip_events(events, start, end)
+        if window.empty:
+            print(f"==No sessions {label}==")
+            continue
+        extra = dict(kwargs)
+        if loans is not None:
+            extra["loans"] = clip_series(loans, start, end)
+        tasks.append((label, report, (window, clip_rows(denied, start, end)), extra))
+
+    with contextlib.ExitStack() as stack:
+        if jobs == 1 or len(tasks) < 2:
+            use_agg()
+            finished = (run_report(*task) for task in tasks)
+        else:
+            pool = ProcessPoolExecutor(max_workers=jobs, initializer=use_agg)
+            finished = stack.enter_context(pool).map(run_report, *zip(*tasks))
+        for directory in finished:
+            print(f'==Report output in "{directory}"==')
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Benchmark the import time of licvis with python -X importtime.
+   Fails if it takes longer than the budget, or if plotting
+   (matplotlib, seaborn) is imported before there's a graph to draw
+
+   usage: bench_import.py [-b BUDGET_MS] [-r REPEAT] [-t TOP]"""
+import os
+import sys
+import argparse
+import subprocess
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# Milliseconds licvis may take to import: pandas and not much else
+BUDGET_MS = 800
+# Only wanted once there's a graph to draw
+PLOTTING = ("matplotlib", "seaborn")
+
+
+def import_times(module):
+    """Run python -X importtime -c "import module" in a fresh interpreter
+    Return list of (self us, cumulative us, name) in the order imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        # import time:       467 |    1076081 | licvis
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        times.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return times
+
+
+def main(args=None):
+    """Import licvis repeat times, report the fastest against the budget"""
+    parser = argparse.ArgumentParser("Benchmark licvis import time.")
+    parser.add_argument("-b", "--budget", type=float, default=BUDGET_MS)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument(
+        "-t", "--top", type=int, default=10, help="Slowest imports to list"
+    )
+    opt = parser.parse_args(args)
+
+    runs = [import_times("licvis") for _ in range(opt.repeat)]
+    best = min(runs, key=lambda times: times[-1][1])
+    total = best[-1][1] / 1000
+    print(
+        f"import licvis: {total:.0f}ms (best of {opt.repeat}), "
+        f"budget {opt.budget:.0f}ms"
+    )
+    print(f"Slowest {opt.top} by own time:")
+    for own, cumulative, name in sorted(best, reverse=True)[: opt.top]:
+        print(f"{own / 1000:8.1f}ms {cumulative / 1000:8.1f}ms  {name}")
+
+    plotting = sorted({name.split(".")[0] for _, _, name in best} & set(PLOTTING))
+    if plotting:
+        print(f"Plotting imported up front: {', '.join(plotting)}")
+    if total > opt.budget or plotting:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Benchmark lmgrd log_parse throughput on a flexlm log from genlogs.py.
+   Compares the tokenizer in lmgrd.py with the original split/strptime
+   parser, kept here as legacy_log_parse for reference
+
+   usage: bench_log_parse.py [-n LINES] [-k]"""
+import re
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lmgrd  # noqa: E402
+import genlogs  # noqa: E402
+
+
+def legacy_log_parse(original_log, current_date):
+    """The per line split, regex and strptime parser we started with"""
+    grabbag = ["IN:", "OUT:", "DENIED:", "QUEUED:", "DEQUEUED:"]
+    lasttime = datetime.datetime.timestamp(current_date)
+    for line in original_log:
+        data = line.split()
+        if len(data) < 4:
+            continue
+        if data[2] == "TIMESTAMP":
+            new_date = datetime.datetime.strptime(data[3], "%m/%d/%Y").date()
+            if new_date != current_date:
+                current_date = new_date
+        token_value = re.compile(r"(?:\s+\((\d+)?\slicenses\))")
+        if [i for i in grabbag if i in data[2]]:
+            record_date = current_date.strftime("%Y-%m-%d")
+            data = f"{record_date} " + " ".join(re.split(r"\s+|@|\.", line))
+            data = data.split(maxsplit=7)
+            unixtime = datetime.datetime.strptime(
+                f"{data[0]}T{data[1]}", "%Y-%m-%dT%H:%M:%S"
+            ).timestamp()
+            if unixtime < lasttime:
+                newdate = datetime.datetime.strptime(
+                    data[0], "%Y-%m-%d"
+                ) + datetime.timedelta(days=1)
+                data[0] = newdate.strftime("%Y-%m-%d")
+                current_date = newdate
+                unixtime = datetime.datetime.strptime(
+                    f"{data[0]}T{data[1]}", "%Y-%m-%dT%H:%M:%S"
+                ).timestamp()
+            lasttime = unixtime
+            if len(data) == 8:
+                if (match := re.search(token_value, data[7])) is not None:
+                    data[7] = int(match.group(1))
+                else:
+                    data[7] = 1
+            else:
+                data.append(1)
+            yield data
+
+
+def time_parser(name, parser, filename):
+    """Run parser over filename, print records and seconds taken
+    Parser progress prints are sent to devnull while timing"""
+    with open(filename, "rt", encoding="utf-8", errors="ignore") as f, open(
+        os.devnull, "w"
+    ) as devnull, contextlib.redirect_stdout(devnull):
+        t = time.perf_counter()
+        kept = sum(1 for _ in parser(f))
+        elapsed = time.perf_counter() - t
+    print(f"{name:>8}: {kept} records in {elapsed:.2f}s")
+    return elapsed
+
+
+def main(args=None):
+    """Generate log, time both parsers, report speedup"""
+    parser = argparse.ArgumentParser("Benchmark lmgrd log_parse.")
+    parser.add_argument("-n", "--lines", type=int, default=10_000_000)
+    parser.add_argument(
+        "-k", "--keep", action="store_true", help="Keep the generated log file"
+    )
+    opt = parser.parse_args(args)
+
+    start = genlogs.START
+    fd, filename = tempfile.mkstemp(suffix=".log", prefix="lmgrd-bench-")
+    os.close(fd)
+    try:
+        print(f"Generating {opt.lines} lines in {filename}")
+        genlogs.generate("flexlm", filename, opt.lines)
+        legacy = time_parser(
+            "legacy", lambda f: legacy_log_parse(f, start), filename
+        )
+        fast = time_parser(
+            "lmgrd", lambda f: lmgrd.parse_events(f, start, tokens=True), filename
+        )
+        print(f" speedup: {legacy / fast:.1f}x")
+    finally:
+        if not opt.keep:
+            os.remove(filename)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
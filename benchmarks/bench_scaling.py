@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Benchmark how licvis scales with the size of the log, every format.
+   Logs of each size are generated with genlogs.py, then each is run in
+   a fresh process timing the stages of licvis separately: log_parse on
+   its own, readfile_to_dataframe, pairing (library and pair), the tables
+   (aggregation) and graph(). Peak RSS is of the process so far, so it
+   says which stage took it up
+
+   usage: bench_scaling.py [-n LINES ...] [-f FORMAT ...] [-k DIR] [--no-graph]"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import contextlib
+import subprocess
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+import genlogs  # noqa: E402
+
+STAGES = ["log_parse", "readfile_to_dataframe", "pairing", "aggregation", "graph"]
+
+
+def peak_rss():
+    """Most memory this process has had, MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the block, quiet, then print its line for the parent"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        t = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - t
+    print(json.dumps({"stage": name, "seconds": elapsed, "rss_mb": peak_rss()}))
+    sys.stdout.flush()
+
+
+def run_stages(name, filename, graph=True):
+    """The licvis pipeline on filename, a JSON line per stage"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import licvis
+    import vendors
+
+    fmt = vendors.get(name)
+    opt = licvis.cmd_args([filename, "--format", name, "--outputs", "csv"])
+    kwargs = licvis.process_opts(opt)
+    # Nothing written, the tables are only worked out
+    opt.outputs = set()
+
+    with stage("log_parse"):
+        with open(filename, "rt", encoding="utf-8", errors="ignore") as f:
+            sum(1 for _ in fmt.log_parse(f, **kwargs))
+    with stage("readfile_to_dataframe"):
+        df = licvis.readfile_to_dataframe(fmt, **kwargs)
+    with stage("pairing"):
+        df_sub, loans = fmt.library(df)
+        events, df_sub_ref = licvis.pair(fmt, df_sub)
+    with tempfile.TemporaryDirectory() as scratch:
+        # Anything the report drops on disk goes with it
+        os.chdir(scratch)
+        with stage("aggregation"):
+            events, loans = fmt.tables(events, df_sub_ref, opt, loans)
+        if graph:
+            with stage("graph"):
+                fmt.graph(events, df_sub_ref, loans)
+        os.chdir(REPO)
+
+
+def measure(name, filename, graph=True):
+    """run_stages in a fresh process, return its stage lines"""
+    args = [sys.executable, __file__, "--stages", name, filename]
+    if not graph:
+        args.append("--no-graph")
+    result = subprocess.run(args, cwd=REPO, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"{name} {filename}:\n{result.stderr}")
+    return [json.loads(line) for line in result.stdout.splitlines()]
+
+
+def main(args=None):
+    """Generate the logs, time the stages on each, print a table"""
+    parser = argparse.ArgumentParser("Benchmark licvis stages by log size.")
+    parser.add_argument("-n", "--lines", type=float, nargs="+", default=[1e4, 1e5, 1e6])
+    parser.add_argument(
+        "-f",
+        "--formats",
+        nargs="+",
+        choices=list(genlogs.FORMATS),
+        default=list(genlogs.FORMATS),
+    )
+    parser.add_argument(
+        "-k", "--keep", help="Keep the generated logs in, and reuse them from, DIR"
+    )
+    parser.add_argument("--no-graph", action="store_true", help="Skip graph()")
+    parser.add_argument("--stages", nargs=2, help=argparse.SUPPRESS)
+    opt = parser.parse_args(args)
+
+    if opt.stages:
+        run_stages(*opt.stages, graph=not opt.no_graph)
+        return
+
+    with tempfile.TemporaryDirectory() as scratch:
+        folder = opt.keep or scratch
+        os.makedirs(folder, exist_ok=True)
+        print(f"{'format':>9} {'lines':>10} " + " ".join(f"{s:>22}" for s in STAGES))
+        for name in opt.formats:
+            for lines in map(int, opt.lines):
+                filename = os.path.join(folder, f"{name}-{lines}.log")
+                if not os.path.exists(filename):
+                    genlogs.generate(name, filename, lines)
+                stages = measure(name, filename, not opt.no_graph)
+                done = {s["stage"]: s for s in stages}
+                cells = [
+                    f"{done[s]['seconds']:9.2f}s {done[s]['rss_mb']:8.0f}MB"
+                    if s in done
+                    else f"{'-':>22}"
+                    for s in STAGES
+                ]
+                print(f"{name:>9} {lines:>10} " + " ".join(cells))
+                sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Check a windowed --rollup update leaves the rollup as a full rebuild
+   has it. A generated log is rolled up whole, then again for a window
+   in the middle of it (a third of the way in to two thirds, off the
+   hour, unless given), and the cells and peaks are compared with those
+   of the whole log rolled up once. Sessions are kept short of the
+   overrun, as the windowed run takes them to be
+
+   usage: check_rollup.py [-f FORMAT] [-n LINES] [-s START] [-e END]"""
+import os
+import sys
+import argparse
+import datetime
+import tempfile
+import contextlib
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+import genlogs  # noqa: E402
+
+
+def rollup_run(directory, filename, fmt, *window):
+    """licvis --rollup directory on filename, quiet and writing no reports"""
+    import licvis
+
+    args = [filename, "--format", fmt, "--rollup", directory, "--outputs", "csv"]
+    # The date the log starts, lmgrd lines before its first TIMESTAMP have it
+    args += ["--hint", genlogs.START.date().isoformat()]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        licvis.main(args + list(window))
+
+
+def table(frame, keys):
+    """frame in key order, strings for categories, to compare"""
+    frame = frame.astype({name: str for name in frame.columns if name != "Hour"})
+    return frame.sort_values(keys, kind="mergesort").reset_index(drop=True)
+
+
+def main(args=None):
+    """Roll up the log whole, then a window of it, compare to once whole"""
+    parser = argparse.ArgumentParser("Check windowed rollup updates.")
+    parser.add_argument(
+        "-f", "--format", choices=list(genlogs.FORMATS), default="flexlm"
+    )
+    parser.add_argument("-n", "--lines", type=float, default=50_000)
+    parser.add_argument("-s", "--start")
+    parser.add_argument("-e", "--end")
+    opt = parser.parse_args(args)
+    import rollup
+
+    with tempfile.TemporaryDirectory() as scratch:
+        filename = os.path.join(scratch, f"{opt.format}.log")
+        # Sessions of 10 minutes on average don't outlast a 12 hour overrun
+        genlogs.generate(opt.format, filename, int(opt.lines), session=10)
+        # Reports land in the scratch directory
+        os.chdir(scratch)
+        updated = os.path.join(scratch, "updated")
+        rebuilt = os.path.join(scratch, "rebuilt")
+        rollup_run(updated, filename, opt.format)
+        if not (opt.start and opt.end):
+            first, last = rollup.Rollup.load(updated).span()
+            third = (last - first) * rollup.HOUR // 3
+            begin = datetime.datetime(1970, 1, 1, 0, 30)
+            begin += datetime.timedelta(seconds=first * rollup.HOUR + third)
+            opt.start = opt.start or f"{begin:%Y-%m-%dT%H:%M}"
+            ending = begin + datetime.timedelta(seconds=third, minutes=17)
+            opt.end = opt.end or f"{ending:%Y-%m-%dT%H:%M}"
+        print(f"==Window {opt.start} to {opt.end}==")
+        rollup_run(updated, filename, opt.format, "-s", opt.start, "-e", opt.end)
+        rollup_run(rebuilt, filename, opt.format)
+        os.chdir(REPO)
+
+        first, second = rollup.Rollup.load(updated), rollup.Rollup.load(rebuilt)
+        keys = ["Hour", *second.by]
+        same = table(first.cells, keys).equals(table(second.cells, keys))
+        peak_keys = ["Hour", "By", "Key"]
+        same_peaks = table(first.peaks, peak_keys).equals(
+            table(second.peaks, peak_keys)
+        )
+    print(f"cells {'same' if same else 'DIFFER'}, ", end="")
+    print(f"peaks {'same' if same_peaks else 'DIFFER'}")
+    return 0 if same and same_peaks else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Write synthetic license server logs in every format licvis reads, any
+   size from a few thousand lines to 10^8, for benchmarks.
+   Sessions start through the working week, quieter nights and weekends.
+   A few users and features are much busier than the rest (Zipf), session
+   lengths are lognormal, and a checkout of a feature with all its seats
+   taken is refused. The sessions are then written as stardrop, geneious,
+   flexlm (SUITE token library) or cresset lines, with the quirks of each:
+   TIMESTAMPs a few times a day and so midnight rollovers, (client exit),
+   version numbers, lines we don't keep
+
+   usage: genlogs.py FORMAT FILENAME [-n LINES] [-u USERS] [-f FEATURES]
+                     [--hosts HOSTS] [--seats SEATS] [--session MINUTES]"""
+import sys
+import math
+import heapq
+import random
+import argparse
+import datetime
+
+START = datetime.datetime(2021, 1, 4)
+# Share of the daytime arrival rate at night and weekends
+QUIET = 0.15
+# Lines buffered per write
+BATCH = 10_000
+MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+
+
+class Population:
+    """Who checks out what, from where, for how long"""
+
+    def __init__(
+        self, users=300, features=40, hosts=None, seats=None, session=90, seed=1
+    ):
+        self.rand = random.Random(seed)
+        self.users = [f"user{i}" for i in range(users)]
+        hosts = hosts or users
+        # Ten PCs to a site: GB03PC0034, the report groups by GB03
+        names = [f"GB{i // 10:02d}PC{i:04d}.corp.example.com" for i in range(hosts)]
+        self.hosts = [names[i % hosts] for i in range(users)]
+        self.features = [f"FEATURE_{i}" for i in range(features)]
+        # Busy ones first: the nth is picked 1/n as often as the first
+        self.user_weights = zipf(users)
+        self.feature_weights = zipf(features)
+        # The pool shared out by how busy each feature is
+        seats = seats or max(2, users // 4)
+        weights = self.feature_weights
+        share = [b - a for a, b in zip([0.0, *weights], weights)]
+        self.seats = [max(1, round(seats * part / weights[-1])) for part in share]
+        self.tokens = [(1, 2, 4, 8)[i % 4] for i in range(features)]
+        # Lognormal lengths with a mean of session minutes
+        self.sigma = 1.0
+        self.mu = math.log(session * 60) - self.sigma**2 / 2
+        # Daytime arrivals per second to keep about 3/4 of the seats busy
+        self.rate = 0.75 * sum(self.seats) / (session * 60)
+
+
+def zipf(count):
+    """Cumulative weights, the nth 1/n as likely as the first"""
+    total, weights = 0.0, []
+    for n in range(1, count + 1):
+        total += 1 / n
+        weights.append(total)
+    return weights
+
+
+def busy(seconds):
+    """Share of the daytime rate at seconds after START (a Monday)"""
+    day, clock = divmod(int(seconds), 86400)
+    return 1.0 if day % 7 < 5 and 8 * 3600 <= clock < 18 * 3600 else QUIET
+
+
+def sessions(pop):
+    """Endless (seconds after START, action, user, feature) in time order
+    action is OUT, IN or DENIED"""
+    rand = pop.rand
+    users, features = range(len(pop.users)), range(len(pop.features))
+    pending = []  # Checkins to come: (when, user, feature)
+    held = set()
+    in_use = [0] * len(pop.features)
+    now = 0.0
+    while True:
+        now += rand.expovariate(pop.rate)
+        if rand.random() > busy(now):
+            continue
+        while pending and pending[0][0] <= now:
+            when, user, feature = heapq.heappop(pending)
+            held.discard((user, feature))
+            in_use[feature] -= 1
+            yield when, "IN", user, feature
+        user = rand.choices(users, cum_weights=pop.user_weights)[0]
+        feature = rand.choices(features, cum_weights=pop.feature_weights)[0]
+        if (user, feature) in held:
+            continue
+        if in_use[feature] >= pop.seats[feature]:
+            yield now, "DENIED", user, feature
+            continue
+        held.add((user, feature))
+        in_use[feature] += 1
+        heapq.heappush(
+            pending, (now + rand.lognormvariate(pop.mu, pop.sigma), user, feature)
+        )
+        yield now, "OUT", user, feature
+
+
+class Dates:
+    """Date of seconds after START, one datetime per day"""
+
+    def __init__(self):
+        self.days = {}
+
+    def __call__(self, seconds):
+        day = int(seconds) // 86400
+        if day not in self.days:
+            self.days[day] = START + datetime.timedelta(days=day)
+        return self.days[day]
+
+
+def clock(seconds):
+    """HH:MM:SS of seconds after START"""
+    minutes, second = divmod(int(seconds) % 86400, 60)
+    hour, minute = divmod(minutes, 60)
+    return f"{hour:02d}:{minute:02d}:{second:02d}"
+
+
+def lmgrd_lines(pop, product="geneious", suite=False):
+    """lmgrd debug log: times of day, a TIMESTAMP at 03:00, 09:00, 15:00
+    and 21:00 so midnight passes without one. geneious has one
+    floating_license, flexlm (suite) the features and SUITE_ token library"""
+    rand, dates = pop.rand, Dates()
+    start = f"{clock(0)} (lmgrd)"
+    yield f"{start} FlexNet Licensing (v11.16.2.0 build 242433 x64_lsb) started"
+    yield f"{start} Starting vendor daemons ..."
+    yield f"{clock(0)} ({product}) Server started on license-server.corp.example.com"
+    yield f"{start} TIMESTAMP {START.month}/{START.day}/{START.year}"
+    stamp = 3 * 3600
+    denied = "  (Licensed number of users already reached. (-4,342))"
+    for when, action, user, feature in sessions(pop):
+        while stamp <= when:
+            day = dates(stamp)
+            for name in ("lmgrd", product):
+                date = f"{day.month}/{day.day}/{day.year}"
+                yield f"{clock(stamp)} ({name}) TIMESTAMP {date}"
+            stamp += 6 * 3600
+        time = clock(when)
+        name = pop.features[feature] if suite else "floating_license"
+        who = f"{pop.users[user]}@{pop.hosts[user]}"
+        if action == "DENIED":
+            yield f'{time} ({product}) DENIED: "{name}" {who}{denied}'
+            continue
+        extra = "  (INACTIVE)" if action == "IN" and rand.random() < 0.05 else ""
+        yield f'{time} ({product}) {action}: "{name}" {who}{extra}'
+        if suite:
+            tokens = pop.tokens[feature]
+            yield (
+                f'{time} ({product}) {action}: "SUITE_ROAD_RUNNER" {who}'
+                f"  ({tokens} licenses)"
+            )
+        if rand.random() < 0.01:
+            yield f'{time} ({product}) UNSUPPORTED: "OLD_KIT" (PORT_AT_HOST   ) {who}'
+
+
+def flexlm_lines(pop):
+    """lmgrd log of modules that take tokens from a SUITE_ library"""
+    return lmgrd_lines(pop, "ACME", suite=True)
+
+
+def cresset_lines(pop):
+    """03/01 00:35:58 (cresset) OUT: ANVIL 1.1 by user@host, some
+    checkins marked (client exit)"""
+    rand, dates = pop.rand, Dates()
+    for when, action, user, feature in sessions(pop):
+        day = dates(when)
+        name = pop.features[feature]
+        version = f"1.{user % 3}"
+        who = f"{pop.users[user]}@{pop.hosts[user]}"
+        exit_ = "(client exit) " if action == "IN" and rand.random() < 0.3 else ""
+        yield (
+            f"{day.month:02d}/{day.day:02d} {clock(when)} (cresset) "
+            f"{action}: {exit_}{name} {version} by {who}"
+        )
+
+
+def stardrop_lines(pop):
+    """LOG:<8 chars>user#License_granted#<number>#19 Nov 2018 06:46, some
+    granted with a version, some checkins purged, refusals and lines
+    we don't keep"""
+    rand, dates = pop.rand, Dates()
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    # Every user has the hash of their install
+    hashes = ["".join(rand.choices(alphabet, k=8)) for _ in pop.users]
+    actions = {"OUT": "License_granted", "DENIED": "License_refused"}
+    for when, action, user, feature in sessions(pop):
+        day = dates(when)
+        minutes = int(when) % 86400 // 60
+        stamp = (
+            f"{day.day} {MONTHS[day.month - 1]} {day.year} "
+            f"{minutes // 60:02d}:{minutes % 60:02d}"
+        )
+        number = 500 + 2 * feature
+        if action == "IN":
+            name = "Purging_license" if rand.random() < 0.25 else "License_released"
+        else:
+            name = actions[action]
+        if action == "OUT" and rand.random() < 0.3:
+            name = f"{name}#7.{user % 3}"
+        yield f"LOG:{hashes[user]}{pop.users[user]}#{name}#{number}#{stamp}"
+        if rand.random() < 0.01:
+            yield f"LOG:00:50:56:85:60:25#Adding_valid_license#{number}#{stamp}"
+
+
+FORMATS = {
+    "stardrop": stardrop_lines,
+    "geneious": lmgrd_lines,
+    "flexlm": flexlm_lines,
+    "cresset": cresset_lines,
+}
+
+
+def generate(fmt, filename, lines, **population):
+    """Write a log of format fmt, lines long, to filename
+    population: Population() settings"""
+    if fmt == "geneious":
+        # One floating_license for everyone
+        population = {**population, "features": 1}
+    source = FORMATS[fmt](Population(**population))
+    with open(filename, "w", encoding="utf-8") as f:
+        while lines > 0:
+            batch = [next(source) for _ in range(min(lines, BATCH))]
+            f.write("\n".join(batch))
+            f.write("\n")
+            lines -= len(batch)
+
+
+def main(args=None):
+    """Generate the log asked for"""
+    parser = argparse.ArgumentParser("Generate synthetic license logs.")
+    parser.add_argument("format", choices=list(FORMATS))
+    parser.add_argument("filename")
+    parser.add_argument("-n", "--lines", type=float, default=100_000)
+    parser.add_argument("-u", "--users", type=int, default=300)
+    parser.add_argument("-f", "--features", type=int, default=40)
+    parser.add_argument("--hosts", type=int, help="PCs, default one per user")
+    parser.add_argument("--seats", type=int, help="Seats in the pool, all features")
+    parser.add_argument(
+        "--session", type=float, default=90, help="Mean session minutes"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    opt = parser.parse_args(args)
+    generate(
+        opt.format,
+        opt.filename,
+        int(opt.lines),
+        users=opt.users,
+        features=opt.features,
+        hosts=opt.hosts,
+        seats=opt.seats,
+        session=opt.session,
+        seed=opt.seed,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
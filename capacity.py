@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Capacity planning report from the events table.
+   How close each feature came to its pool of seats: time weighted
+   percentiles of licenses in use, overall and per hour of day, how long
+   it sat at or above a seat count and its busiest windows.
+   All interval arithmetic on the concurrency change points, no per minute
+   loops, so a year of sessions takes seconds"""
+import numpy as np
+import pandas as pd
+import concurrency
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+def held_levels(changes, freq=None):
+    """Each level of a change_points table and the seconds it held (Held)
+    Every group is covered from the first change of any group to the last,
+    idle time counts as 0 in use. freq cuts the levels at period boundaries
+    (e.g. "1h") so that each piece falls in a single period"""
+    keys = [name for name in changes.columns if name not in ("Date", "InUse")]
+    start, end = changes["Date"].min(), changes["Date"].max()
+    groups = changes[keys].drop_duplicates()
+    # Nothing in use from the start until a group's first checkout
+    idle = groups.assign(Date=start, InUse=0)
+    pieces = [idle, changes]
+    if freq:
+        edges = pd.DataFrame(
+            {"Date": pd.date_range(start.floor(freq), end, freq=freq)}
+        )
+        grid = groups.merge(edges, how="cross").sort_values("Date", kind="stable")
+        grid = pd.merge_asof(
+            grid, changes.sort_values("Date", kind="stable"), on="Date", by=keys
+        )
+        pieces.append(grid.fillna({"InUse": 0}))
+    levels = pd.concat(pieces, ignore_index=True)
+    levels["InUse"] = levels["InUse"].astype(np.int64)
+    levels = levels.sort_values([*keys, "Date"], kind="stable")
+    levels = levels.drop_duplicates([*keys, "Date"], keep="last")
+
+    following = levels.groupby(keys, observed=True)["Date"].shift(-1)
+    held = following.fillna(end) - levels["Date"]
+    levels["Held"] = held.dt.total_seconds()
+    return levels.reset_index(drop=True)
+
+
+def weighted_percentiles(levels, keys, percentiles=PERCENTILES):
+    """Time weighted percentiles and max of InUse for each keys group
+    Return DataFrame of p50, p90... and max columns"""
+    levels = levels[levels["Held"] > 0].sort_values([*keys, "InUse"], kind="stable")
+    grouped = levels.groupby(keys, observed=True)["Held"]
+    share = grouped.cumsum() / grouped.transform("sum")
+    result = {}
+    for percentile in percentiles:
+        # Lowest level in use at least this share of the time
+        reached = levels[share >= percentile - 1e-12]
+        result[f"p{percentile * 100:g}"] = reached.groupby(keys, observed=True)[
+            "InUse"
+        ].first()
+    result["max"] = levels.groupby(keys, observed=True)["InUse"].max()
+    return pd.DataFrame(result)
+
+
+def minutes_at(levels, keys, seats=None):
+    """Minutes each group spent with seats or more in use, at its own
+    peak when seats isn't given"""
+    if seats is None:
+        seats = levels.groupby(keys, observed=True)["InUse"].transform("max")
+    busy = levels[(levels["InUse"] >= seats) & (levels["InUse"] > 0)]
+    minutes = busy.groupby(keys, observed=True)["Held"].sum() / 60
+    return minutes.reindex(levels.groupby(keys, observed=True).size().index).fillna(0)
+
+
+def busiest_windows(changes, keys, window="1h", top=10):
+    """The top windows of each group by time weighted mean in use
+    Return DataFrame [*keys, Start, Mean, Peak]"""
+    mean = concurrency.resample_usage(changes, window, "mean")
+    peak = concurrency.resample_usage(changes, window, "max")
+    # One row per group and window, column by column
+    groups = mean.columns.to_frame(index=False)
+    windows = groups.loc[groups.index.repeat(len(mean))].reset_index(drop=True)
+    windows["Start"] = np.tile(mean.index, len(groups))
+    windows["Mean"] = mean.to_numpy().ravel(order="F")
+    windows["Peak"] = peak.to_numpy().ravel(order="F")
+    windows = windows.sort_values(
+        [*keys, "Mean", "Peak"], ascending=[True] * len(keys) + [False, False]
+    )
+    windows = windows.groupby(keys, observed=True).head(top)
+    return windows[[*keys, "Start", "Mean", "Peak"]].reset_index(drop=True)
+
+
+def capacity_report(events, by=None, tokens=None, seats=None, window="1h", top=10):
+    """Capacity tables for an events table (pairing.pair_sessions)
+    by: columns to report on separately, e.g. ["Module"]; everything
+    together as Feature "All" when not given. tokens: column of licenses
+    per session. seats: count minutes at or above this many in use
+    Return (summary, hourly, busiest) DataFrames"""
+    if not by:
+        events = events.assign(Feature="All")
+        by = ["Feature"]
+    keys = list(by)
+    changes = concurrency.session_changes(events, tokens=tokens, by=keys)
+    if changes.empty:
+        raise ValueError("No sessions to report capacity on")
+
+    levels = held_levels(changes)
+    summary = weighted_percentiles(levels, keys)
+    summary["Sessions"] = events.groupby(keys, observed=True).size()
+    summary["Seats"] = seats if seats is not None else summary["max"]
+    summary["MinutesAtSeats"] = minutes_at(levels, keys, seats).round(1)
+
+    hours = held_levels(changes, "1h")
+    hours["Hour"] = hours["Date"].dt.hour
+    hourly = weighted_percentiles(hours, [*keys, "Hour"])
+
+    busiest = busiest_windows(changes, keys, window, top)
+    return summary, hourly, busiest
+
+
+def write_capacity(events, name, fmt, opt, **kwargs):
+    """Print the capacity summary, write {name}-capacity.csv,
+    {name}-capacity-hourly.csv and {name}-busiest.csv through fmt.save,
+    so only if --outputs (in opt) has csv"""
+    summary, hourly, busiest = capacity_report(events, **kwargs)
+    print("==Licenses in use, time weighted percentiles==")
+    print(summary.to_string())
+    fmt.save(summary, f"{name}-capacity.csv", opt, encoding="utf8")
+    fmt.save(hourly, f"{name}-capacity-hourly.csv", opt, encoding="utf8")
+    fmt.save(busiest, f"{name}-busiest.csv", opt, encoding="utf8", index=False)
+    print(
+        f'==Capacity by hour of day and busiest windows== output as '
+        f'"{name}-capacity-hourly.csv" and "{name}-busiest.csv"'
+    )
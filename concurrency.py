@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Exact licenses in use over time, by sweeping checkout/checkin events.
+   Every checkout adds its tokens and every checkin takes them away; the
+   events are sorted once and a running sum gives the level in use. We keep
+   only the change points, the level holds until the next one, and
+   resample to whatever resolution a graph or report wants"""
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+
+def change_points(when, delta, by=None):
+    """Step function of usage from events adding delta at when
+    by: optional dict of name -> array to keep a separate level for,
+    e.g. {"Module": ...} or {"Host": ...}
+    Return DataFrame [*by, Date, InUse] in Date order per group, InUse
+    is the level from Date until the next change point of its group.
+    Events at the same instant are summed, so collisions can't misalign"""
+    by = by or {}
+    frame = pd.DataFrame(
+        {
+            **by,
+            "Date": as_datetimes(when),
+            "Delta": np.asarray(delta, dtype=np.int64),
+        },
+        copy=False,
+    )
+    keys = list(by)
+    frame = frame.sort_values([*keys, "Date"], kind="stable")
+    if keys:
+        frame["InUse"] = frame.groupby(keys, observed=True, sort=False)[
+            "Delta"
+        ].cumsum()
+    else:
+        frame["InUse"] = frame["Delta"].cumsum()
+    # Only the level after the last event at an instant holds
+    last = ~frame.duplicated([*keys, "Date"], keep="last")
+    return frame.loc[last, [*keys, "Date", "InUse"]].reset_index(drop=True)
+
+
+def as_datetimes(when):
+    """datetime64 array of when, timezone aware times as naive UTC"""
+    dates = pd.DatetimeIndex(when)
+    if dates.tz is not None:
+        dates = dates.tz_convert(None)
+    return dates.to_numpy()
+
+
+def session_changes(events, tokens=None, by=None):
+    """change_points of the sessions in an events table (pair_sessions)
+    tokens: column of licenses each session holds, default 1
+    by: columns of events to keep a separate level for"""
+    held = np.ones(len(events), dtype=np.int64)
+    if tokens:
+        held = events[tokens].to_numpy(dtype=np.int64)
+    groups = {}
+    for name in by or []:
+        column = events[name]
+        groups[name] = pd.concat([column, column], ignore_index=True)
+    when = np.concatenate([as_datetimes(events.LicOut), as_datetimes(events.LicIn)])
+    return change_points(when, np.concatenate([held, -held]), groups)
+
+
+def usage_series(changes):
+    """Series of InUse indexed by Date, for a change_points table of one
+    group. Plot with drawstyle="steps-post" to draw it exactly"""
+    return pd.Series(
+        changes["InUse"].to_numpy(), index=pd.DatetimeIndex(changes["Date"])
+    )
+
+
+def level_at(changes, times):
+    """Level of one group's step function at each of times, 0 before
+    its first change"""
+    dates = changes["Date"].to_numpy()
+    levels = changes["InUse"].to_numpy()
+    found = np.searchsorted(dates, np.asarray(times, dtype=dates.dtype), "right") - 1
+    return np.where(found >= 0, levels[np.maximum(found, 0)], 0)
+
+
+def resample_usage(changes, freq, how="max"):
+    """Usage per period of freq (fixed pandas offset, "15min", "1h", "1D")
+    how: "max" peak in use during the period, "mean" time weighted average
+    Return DataFrame with a row per period and a column per group
+    (a single "InUse" column when changes has no groups)"""
+    if how not in ("max", "mean"):
+        raise ValueError(f"Can't resample usage by {how}, use max or mean")
+    keys = [name for name in changes.columns if name not in ("Date", "InUse")]
+    if changes.empty:
+        return pd.DataFrame()
+    # Periods covering every change point
+    offset = to_offset(freq)
+    starts = pd.date_range(
+        changes["Date"].min().floor(offset), changes["Date"].max(), freq=offset
+    )
+    edges = starts.append(pd.DatetimeIndex([starts[-1] + offset]))
+
+    if keys:
+        groups = changes.groupby(keys, observed=True, sort=True)
+    else:
+        groups = [("InUse", changes)]
+    result = {}
+    for name, group in groups:
+        if how == "max":
+            result[name] = peak_per_period(group, edges)
+        else:
+            result[name] = mean_per_period(group, edges)
+    usage = pd.DataFrame(result, index=starts)
+    if keys:
+        usage.columns.names = keys
+    return usage
+
+
+def peak_per_period(changes, edges):
+    """Highest level between each pair of edges"""
+    dates = changes["Date"].to_numpy()
+    levels = changes["InUse"].to_numpy()
+    peak = level_at(changes, edges[:-1])
+    # Period each change point falls in
+    period = np.searchsorted(edges.to_numpy(dtype=dates.dtype), dates, "right") - 1
+    inside = pd.Series(levels).groupby(period).max()
+    peak[inside.index] = np.maximum(peak[inside.index], inside.to_numpy())
+    return peak
+
+
+def mean_per_period(changes, edges):
+    """Time weighted average level between each pair of edges"""
+    dates = changes["Date"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+    levels = changes["InUse"].to_numpy().astype(np.float64)
+    points = edges.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    # Area under the steps up to each change point, then up to each edge
+    area = np.concatenate([[0.0], np.cumsum(levels[:-1] * np.diff(dates))])
+    found = np.searchsorted(dates, points, "right") - 1
+    before = found >= 0
+    found = np.maximum(found, 0)
+    total = np.where(
+        before, area[found] + levels[found] * (points - dates[found]), 0.0
+    )
+    return np.diff(total) / np.diff(points)
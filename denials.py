@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Who held the licenses when a checkout was refused.
+   Each denial is a stabbing query against the session intervals of the
+   events table: which sessions on its feature were open at that instant.
+   Sessions are sorted by checkout once per feature and all the denials
+   answered together with searchsorted, not a scan of the sessions each"""
+import numpy as np
+import pandas as pd
+from concurrency import as_datetimes
+
+
+def denial_context(denied, events, by=None, tokens=None):
+    """For each refused checkout in denied (Date, User and by columns)
+    find the sessions in events open on the same by columns at that time
+    tokens: column of licenses each session holds, default 1
+    Return DataFrame [Date, User, *by, Sessions, InUse, OldestHeld, Holders]
+    Holders are the users with a session open, longest held first"""
+    by = list(by or [])
+    denied = denied.reset_index(drop=True)
+    context = denied[["Date", "User", *by]].copy()
+    context["Sessions"] = 0
+    context["InUse"] = 0
+    context["OldestHeld"] = pd.NaT
+    context["Holders"] = ""
+    if denied.empty:
+        return context
+
+    times = as_datetimes(denied["Date"]).astype("datetime64[ns]")
+    starts = as_datetimes(events["LicOut"]).astype("datetime64[ns]")
+    ends = as_datetimes(events["LicIn"]).astype("datetime64[ns]")
+    held = np.ones(len(events), dtype=np.int64)
+    if tokens:
+        held = events[tokens].to_numpy(dtype=np.int64)
+    users = events["User"].astype(str).to_numpy()
+
+    # Number the features across both tables so they compare
+    keys = pd.concat(
+        [events[by].astype(object), denied[by].astype(object)], ignore_index=True
+    )
+    if by:
+        codes = keys.groupby(by, sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        codes = np.zeros(len(keys), dtype=np.int64)
+    session_codes, denial_codes = codes[: len(events)], codes[len(events) :]
+
+    sessions = np.zeros(len(denied), dtype=np.int64)
+    in_use = np.zeros(len(denied), dtype=np.int64)
+    oldest = np.full(len(denied), np.timedelta64("NaT"), dtype="timedelta64[ns]")
+    holders = np.full(len(denied), "", dtype=object)
+    for code in np.unique(denial_codes):
+        wanted = np.flatnonzero(denial_codes == code)
+        mine = np.flatnonzero(session_codes == code)
+        mine = mine[np.argsort(starts[mine], kind="stable")]
+        found = stab(starts[mine], ends[mine], held[mine], users[mine], times[wanted])
+        sessions[wanted], in_use[wanted], oldest[wanted], holders[wanted] = found
+
+    context["Sessions"] = sessions
+    context["InUse"] = in_use
+    context["OldestHeld"] = oldest
+    context["Holders"] = holders
+    return context
+
+
+def stab(starts, ends, held, users, times):
+    """Sessions (sorted by start) open at each of times, start <= time < end
+    Return arrays of open count, tokens held, age of the oldest open
+    session and the users holding them"""
+    # Retry storms repeat the same instants, answer each once
+    instants, inverse = np.unique(times, return_inverse=True)
+    # Sessions started by each instant; those before the first one still
+    # open (the first to end after it, by the running max of the ends)
+    # have all finished
+    last = np.searchsorted(starts, instants, "right")
+    reach = np.maximum.accumulate(ends) if len(ends) else ends
+    first = np.minimum(np.searchsorted(reach, instants, "right"), last)
+
+    # Every candidate session between first and last, then keep the open ones
+    span = last - first
+    owner = np.repeat(np.arange(len(instants)), span)
+    position = np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span)
+    position += np.repeat(first, span)
+    still_open = ends[position] > instants[owner]
+    owner, position = owner[still_open], position[still_open]
+
+    count = np.bincount(owner, minlength=len(instants))
+    tokens = np.bincount(owner, weights=held[position], minlength=len(instants))
+    age = np.full(len(instants), np.timedelta64("NaT"), dtype="timedelta64[ns]")
+    busy = count > 0
+    age[busy] = instants[busy] - starts[first[busy]]
+    names = np.full(len(instants), "", dtype=object)
+    if len(owner):
+        # owner is sorted, each instant's holders are one run of it
+        cuts = np.flatnonzero(np.diff(owner)) + 1
+        holders = np.split(users[position], cuts)
+        names[owner[np.r_[0, cuts]]] = ["; ".join(run) for run in holders]
+    return (
+        count[inverse],
+        tokens.astype(np.int64)[inverse],
+        age[inverse],
+        names[inverse],
+    )
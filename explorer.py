@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Self contained HTML page to pan and zoom around the sessions of a run,
+   instead of rerunning the script with another --start/--end.
+   Each user's occupancy per hour, day and week, the licenses in use at
+   the same steps, and the raw sessions of the last few weeks are worked
+   out once and embedded in the page. A small canvas viewer draws the
+   finest of them that fits the screen; no server, no more Python"""
+import json
+import base64
+import html
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps
+from matplotlib.colors import to_hex
+import batch
+import concurrency
+import timeline
+
+# Rollups, finest first
+LEVELS = [("hour", "1h"), ("day", "1D"), ("week", "7D")]
+# Skip a rollup with more users x periods than this, it would bloat the page
+MAX_CELLS = 4_000_000
+# Raw sessions for the most recent stretch of the log
+RAW_SPAN = pd.Timedelta(weeks=4)
+MAX_RAW = 100_000
+
+
+def write_explorer(events, filename, color_by, denied=None, tokens=None, title=""):
+    """Write the explorer page for events (LicOut, LicIn, User, color_by)
+    denied: refusals (Date, User) to mark. tokens: column of licenses each
+    session holds for the licenses in use panel, default 1"""
+    if events.empty:
+        raise ValueError("No sessions to explore")
+    page = explorer_data(events, color_by, denied, tokens)
+    page["title"] = title
+    # Nothing in the data can close the script element
+    data = json.dumps(page, separators=(",", ":")).replace("</", "<\\/")
+    with open(filename, "w", encoding="utf8") as f:
+        f.write(
+            TEMPLATE.replace("__TITLE__", html.escape(title)).replace("__DATA__", data)
+        )
+    print(f'==Pan and zoom in a browser== output as "{filename}"')
+
+
+def explorer_data(events, color_by, denied=None, tokens=None):
+    """Everything the viewer draws, times in seconds from the first checkout"""
+    rows = timeline.user_rows(events, denied)
+    row = rows.get_indexer(events["User"].astype(object))
+    labels = pd.unique(events[color_by].astype(str))
+    codes = pd.Categorical(events[color_by].astype(str), categories=labels).codes
+    palette = colormaps["tab20"].colors
+
+    first = pd.Timestamp(concurrency.as_datetimes(events["LicOut"]).min())
+    last = pd.Timestamp(concurrency.as_datetimes(events["LicIn"]).max())
+    page = {
+        "t0": first.isoformat() + "Z",
+        "start": 0.0,
+        "end": seconds(last, first),
+        "users": [str(user) for user in rows],
+        "labels": [str(label) for label in labels],
+        "colors": [to_hex(palette[i % len(palette)]) for i in range(len(labels))],
+        "rowColor": timeline.row_codes(len(rows), row, codes).tolist(),
+        "levels": [],
+        "denied": [],
+    }
+    changes = concurrency.session_changes(events, tokens=tokens)
+    page["maxInUse"] = int(changes["InUse"].max())
+
+    for name, freq in LEVELS:
+        periods = (last - first) / pd.Timedelta(freq) + 2
+        if periods * len(rows) > MAX_CELLS:
+            continue
+        page["levels"].append(rollup(events, changes, rows, name, freq, first))
+    page["raw"] = recent(events, changes, row, codes, first, last)
+
+    if denied is not None and len(denied):
+        page["denied"] = [
+            seconds(concurrency.as_datetimes(denied["Date"]), first).round(1).tolist(),
+            rows.get_indexer(denied["User"].astype(object)).tolist(),
+        ]
+    return page
+
+
+def seconds(when, first):
+    """when (Timestamp or datetime64 array) as seconds after first"""
+    return (when - np.datetime64(first)) / np.timedelta64(1, "s")
+
+
+def rollup(events, changes, rows, name, freq, first):
+    """One level: each user's share of every period as a byte, rows one
+    after another, and the peak and mean licenses in use per period"""
+    start, usage = timeline.occupancy(events, rows, freq)
+    # Any use at all is at least 1 so it shows
+    cells = np.ceil(np.clip(usage, 0, 1) * 255).astype(np.uint8)
+    peak = concurrency.resample_usage(changes, freq, "max")["InUse"]
+    mean = concurrency.resample_usage(changes, freq, "mean")["InUse"]
+    return {
+        "name": name,
+        "freq": pd.Timedelta(freq).total_seconds(),
+        "start": seconds(start, first),
+        "count": cells.shape[1],
+        "cells": base64.b64encode(cells.tobytes()).decode("ascii"),
+        "peak": peak.to_numpy().astype(int).tolist(),
+        "mean": mean.to_numpy().round(2).tolist(),
+    }
+
+
+def recent(events, changes, row, codes, first, last):
+    """Raw sessions, clipped, and change points of the licenses in use for
+    the last RAW_SPAN of the log, no more than MAX_RAW sessions"""
+    start = max(last - RAW_SPAN, first)
+    window = batch.clip_events(events, start, last)
+    if len(window) > MAX_RAW:
+        outs = np.sort(concurrency.as_datetimes(window["LicOut"]))
+        start = pd.Timestamp(outs[-MAX_RAW])
+        window = batch.clip_events(events, start, last)
+    # Sorted by colour so the viewer changes fill as little as it can
+    where = events.index.get_indexer(window.index)
+    order = np.argsort(codes[where], kind="stable")
+    outs = seconds(concurrency.as_datetimes(window["LicOut"]), first)[order]
+    ins = seconds(concurrency.as_datetimes(window["LicIn"]), first)[order]
+
+    dates = changes["Date"].to_numpy()
+    later = dates > np.datetime64(start)
+    opening = concurrency.level_at(changes, pd.DatetimeIndex([start]))
+    return {
+        "start": seconds(start, first),
+        "end": seconds(last, first),
+        "sessions": [
+            outs.round(1).tolist(),
+            ins.round(1).tolist(),
+            row[where][order].tolist(),
+            codes[where][order].tolist(),
+        ],
+        "changes": [
+            [seconds(start, first), *seconds(dates[later], first).round(1).tolist()],
+            [int(opening[0]), *changes["InUse"].to_numpy()[later].tolist()],
+        ],
+    }
+
+
+TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>__TITLE__ sessions</title>
+<style>
+body { font: 13px sans-serif; margin: 8px; }
+#legend span { display: inline-block; margin-right: 12px; }
+#legend i { display: inline-block; width: 10px; height: 10px; margin-right: 4px; }
+canvas { width: 100%; cursor: grab; display: block; }
+</style></head><body>
+<div><b>__TITLE__</b> <span id="status"></span>
+ &mdash; wheel to zoom, drag to pan, double click for everything</div>
+<div id="legend"></div>
+<canvas id="view"></canvas>
+<script type="application/json" id="data">__DATA__</script>
+<script>
+"use strict";
+const data = JSON.parse(document.getElementById("data").textContent);
+const T0 = Date.parse(data.t0) / 1000;
+const LEFT = 110, AXIS = 24, USAGE = 120;
+const ROW = Math.max(2, Math.min(14, Math.floor(2400 / Math.max(1, data.users.length))));
+const canvas = document.getElementById("view"), ctx = canvas.getContext("2d");
+const off = document.createElement("canvas");
+const rgb = data.colors.map(h => [1, 3, 5].map(i => parseInt(h.slice(i, i + 2), 16)));
+rgb.push([128, 128, 128]);
+const colorOf = code => rgb[code < 0 ? rgb.length - 1 : code];
+for (const level of data.levels) {
+  const bytes = atob(level.cells);
+  level.cells = new Uint8Array(bytes.length);
+  for (let i = 0; i < bytes.length; i++) level.cells[i] = bytes.charCodeAt(i);
+}
+let view = [data.start, data.end];
+
+document.getElementById("legend").innerHTML = data.labels.map((label, i) =>
+  `<span><i style="background:${data.colors[i]}"></i>${label
+    .replace(/&/g, "&amp;").replace(/</g, "&lt;")}</span>`).join("");
+
+function when(t, step) {
+  const text = new Date((T0 + t) * 1000).toISOString().replace("T", " ");
+  return step >= 86400 ? text.slice(0, 10) : text.slice(0, 16);
+}
+
+function drawLevel(level, W, H, scale) {
+  const rows = data.users.length, image = ctx.createImageData(W, rows);
+  const px = image.data, peak = [], mean = [];
+  for (let c = 0; c < W; c++) {
+    const b = Math.floor((view[0] + c / scale - level.start) / level.freq);
+    if (b < 0 || b >= level.count) continue;
+    peak[c] = level.peak[b];
+    mean[c] = level.mean[b];
+    for (let r = 0; r < rows; r++) {
+      const v = level.cells[r * level.count + b];
+      if (!v) continue;
+      const color = colorOf(data.rowColor[r]), i = (r * W + c) * 4;
+      px[i] = color[0]; px[i + 1] = color[1]; px[i + 2] = color[2]; px[i + 3] = v;
+    }
+  }
+  off.width = W;
+  off.height = rows;
+  off.getContext("2d").putImageData(image, 0, 0);
+  ctx.imageSmoothingEnabled = false;
+  ctx.drawImage(off, LEFT, 0, W, H);
+  // Licenses in use: peak as a line, mean filled
+  const top = H + AXIS, y = v => top + USAGE - (v / Math.max(1, data.maxInUse)) * USAGE;
+  ctx.fillStyle = "rgba(44,160,44,0.4)";
+  ctx.strokeStyle = "rgb(44,160,44)";
+  ctx.beginPath();
+  for (let c = 0; c < W; c++) {
+    if (mean[c] === undefined) continue;
+    ctx.fillRect(LEFT + c, y(mean[c]), 1, top + USAGE - y(mean[c]));
+    ctx.lineTo(LEFT + c, y(peak[c]));
+  }
+  ctx.stroke();
+}
+
+function drawRaw(W, H, scale) {
+  const [outs, ins, rows, codes] = data.raw.sessions;
+  const x = t => LEFT + (t - view[0]) * scale;
+  let code = null;
+  for (let i = 0; i < outs.length; i++) {
+    if (ins[i] < view[0] || outs[i] > view[1]) continue;
+    if (codes[i] !== code) {
+      code = codes[i];
+      ctx.fillStyle = `rgb(${colorOf(code).join(",")})`;
+    }
+    const left = Math.max(LEFT, x(outs[i]));
+    ctx.fillRect(left, rows[i] * ROW + 1, Math.max(1, x(ins[i]) - left), Math.max(1, ROW - 2));
+  }
+  const [times, levels] = data.raw.changes;
+  const top = H + AXIS, y = v => top + USAGE - (v / Math.max(1, data.maxInUse)) * USAGE;
+  ctx.strokeStyle = "rgb(44,160,44)";
+  ctx.beginPath();
+  for (let i = 0; i < times.length; i++) {
+    if (times[i] > view[1]) break;
+    const next = i + 1 < times.length ? times[i + 1] : data.raw.end;
+    if (next < view[0]) continue;
+    ctx.moveTo(Math.max(LEFT, x(times[i])), y(levels[i]));
+    ctx.lineTo(Math.min(LEFT + W, x(next)), y(levels[i]));
+  }
+  ctx.stroke();
+}
+
+function draw() {
+  canvas.width = canvas.clientWidth;
+  const W = canvas.width - LEFT, H = data.users.length * ROW;
+  canvas.height = H + AXIS + USAGE + 4;
+  const span = view[1] - view[0], scale = W / span;
+  let shown;
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  ctx.save();
+  ctx.beginPath();
+  ctx.rect(LEFT, 0, W, canvas.height);
+  ctx.clip();
+  if (view[0] >= data.raw.start && span <= data.raw.end - data.raw.start) {
+    drawRaw(W, H, scale);
+    shown = "sessions";
+  } else {
+    const level = data.levels.find(l => span / l.freq <= W) || data.levels[data.levels.length - 1];
+    if (level) drawLevel(level, W, H, scale);
+    shown = level ? `per ${level.name}` : "";
+  }
+  // Refusals
+  const [times, rows] = data.denied.length ? data.denied : [[], []];
+  ctx.strokeStyle = "red";
+  ctx.beginPath();
+  for (let i = 0; i < times.length; i++) {
+    if (times[i] < view[0] || times[i] > view[1]) continue;
+    const cx = LEFT + (times[i] - view[0]) * scale, cy = rows[i] * ROW + ROW / 2, d = 3;
+    ctx.moveTo(cx - d, cy - d); ctx.lineTo(cx + d, cy + d);
+    ctx.moveTo(cx - d, cy + d); ctx.lineTo(cx + d, cy - d);
+  }
+  ctx.stroke();
+  ctx.restore();
+
+  // Users and time axis
+  ctx.fillStyle = "black";
+  ctx.font = `${Math.min(11, ROW - 1)}px sans-serif`;
+  if (ROW >= 8) data.users.forEach((user, r) => ctx.fillText(user, 2, r * ROW + ROW - 2, LEFT - 4));
+  ctx.font = "11px sans-serif";
+  ctx.fillText(`${data.maxInUse} in use`, 2, H + AXIS + 10);
+  const steps = [60, 300, 900, 3600, 10800, 21600, 43200, 86400, 604800, 2592000, 7776000, 31536000];
+  const step = steps.find(s => s * scale >= 110) || steps[steps.length - 1];
+  ctx.strokeStyle = "#ddd";
+  ctx.beginPath();
+  for (let t = Math.ceil((T0 + view[0]) / step) * step - T0; t <= view[1]; t += step) {
+    const x = LEFT + (t - view[0]) * scale;
+    ctx.moveTo(x, 0); ctx.lineTo(x, H + AXIS + USAGE);
+    ctx.fillText(when(t, step), x + 2, H + 16);
+  }
+  ctx.stroke();
+  document.getElementById("status").textContent =
+    `${when(view[0], 0)} to ${when(view[1], 0)}, ${shown}`;
+}
+
+canvas.addEventListener("wheel", event => {
+  event.preventDefault();
+  const W = canvas.width - LEFT, span = view[1] - view[0];
+  const at = view[0] + (event.offsetX - LEFT) / W * span;
+  const factor = Math.min(Math.max(Math.exp(event.deltaY * 0.002), 60 / span),
+                          2 * (data.end - data.start) / span);
+  view = [at - (at - view[0]) * factor, at + (view[1] - at) * factor];
+  draw();
+}, { passive: false });
+let drag = null;
+canvas.addEventListener("mousedown", event => { drag = [event.offsetX, view]; });
+window.addEventListener("mouseup", () => { drag = null; });
+canvas.addEventListener("mousemove", event => {
+  if (!drag) return;
+  const shift = (event.offsetX - drag[0]) / (canvas.width - LEFT) * (drag[1][1] - drag[1][0]);
+  view = [drag[1][0] - shift, drag[1][1] - shift];
+  draw();
+});
+canvas.addEventListener("dblclick", () => { view = [data.start, data.end]; draw(); });
+window.addEventListener("resize", draw);
+draw();
+</script></body></html>
+"""
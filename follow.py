@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Follow growing license logs and keep sessions and usage current.
+   Each log is tailed in its own asyncio task, new lines are handed to the
+   script's log_parse generator and every record updates a SessionTable
+   with O(1) work. Rotation and truncation are spotted and followed"""
+import os
+import asyncio
+import collections
+import pandas as pd
+
+# Change points of total usage kept for the loans panel
+HISTORY_LENGTH = 100_000
+# Finished sessions and refusals kept for the snapshots, the latest
+FINISHED_LENGTH = 100_000
+# Bytes read from a log at a time
+READ_SIZE = 1 << 20
+
+
+class SessionTable:
+    """Open sessions per key, licenses in use per feature and the latest
+    sessions that have finished. A checkin closes the oldest open session
+    on its key, the same as pairing.pair_sessions"""
+
+    def __init__(self):
+        self.open = collections.defaultdict(collections.deque)
+        self.usage = collections.Counter()
+        self.sessions = collections.Counter()
+        self.total = 0
+        # Capped like history, so a snapshot costs the same however long
+        # we've been following
+        self.closed = collections.deque(maxlen=FINISHED_LENGTH)
+        self.denials = collections.deque(maxlen=FINISHED_LENGTH)
+        self.history = collections.deque(maxlen=HISTORY_LENGTH)
+
+    def checkout(self, key, when, feature, tokens=1, **extra):
+        """Start a session on key, extra columns are kept for the events table"""
+        self.open[key].append((when, feature, tokens, extra))
+        self.usage[feature] += tokens
+        self.sessions[feature] += 1
+        self.total += tokens
+        self.history.append((when, self.total))
+
+    def checkin(self, key, when):
+        """Close the oldest open session on key, False if there wasn't one"""
+        sessions = self.open.get(key)
+        if not sessions:
+            return False
+        out_time, feature, tokens, extra = sessions.popleft()
+        if not sessions:
+            del self.open[key]
+        self.usage[feature] -= tokens
+        self.sessions[feature] -= 1
+        self.total -= tokens
+        self.closed.append({"LicOut": out_time, "LicIn": when, **extra})
+        self.history.append((when, self.total))
+        return True
+
+    def deny(self, when, **extra):
+        """Record a refused checkout"""
+        self.denials.append({"Date": when, **extra})
+
+    def events(self, columns):
+        """Finished sessions as an events table in the same column
+        layout pairing.pair_sessions gives"""
+        read = [column for column in columns if column != "Duration"]
+        events = pd.DataFrame(self.closed, columns=read)
+        events["LicOut"] = pd.to_datetime(events["LicOut"], utc=True)
+        events["LicIn"] = pd.to_datetime(events["LicIn"], utc=True)
+        events["Duration"] = events.LicIn - events.LicOut
+        return events[list(columns)]
+
+    def denied(self, columns):
+        """Refused checkouts as a frame like df_sub_ref"""
+        return pd.DataFrame(self.denials, columns=["Date", *columns])
+
+    def in_use(self):
+        """Licenses and sessions in use now per feature"""
+        usage = pd.DataFrame(
+            {
+                "Tokens": pd.Series(self.usage, dtype="int64"),
+                "Sessions": pd.Series(self.sessions, dtype="int64"),
+            }
+        )
+        usage.index.name = "Module"
+        return usage[usage.Sessions > 0]
+
+    def loans(self):
+        """Series of total licenses in use at each change"""
+        if not self.history:
+            return pd.Series(dtype="int64")
+        when, total = zip(*self.history)
+        return pd.Series(total, index=pd.DatetimeIndex(when))
+
+
+async def follow_lines(filename, poll=1.0):
+    """Async generator of lists of new whole lines in filename, from the
+    start of the file and then as it grows. When the log is rotated the
+    rest of the old file is read and the new one followed from its start;
+    when it is truncated we go back to the start"""
+    f = None
+    partial = b""
+    while True:
+        if f is None:
+            try:
+                f = open(filename, "rb")
+            except FileNotFoundError:
+                await asyncio.sleep(poll)
+                continue
+            partial = b""
+        chunk = f.read(READ_SIZE)
+        if chunk:
+            lines = (partial + chunk).split(b"\n")
+            partial = lines.pop()
+            yield [line.decode("utf-8", errors="ignore") + "\n" for line in lines]
+            # Let the other logs have a turn while we catch up on a backlog
+            await asyncio.sleep(0)
+            continue
+
+        await asyncio.sleep(poll)
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            # Mid rotation, the new log isn't there yet
+            continue
+        if stat.st_ino != os.fstat(f.fileno()).st_ino:
+            print(f"{filename} rotated, following the new log")
+            # Whatever was written to the old log since, the last line
+            # even without its newline, it won't be finished now
+            lines = (partial + f.read()).split(b"\n")
+            if not lines[-1]:
+                lines.pop()
+            f.close()
+            f = None
+            if lines:
+                yield [line.decode("utf-8", errors="ignore") + "\n" for line in lines]
+        elif stat.st_size < f.tell():
+            print(f"{filename} truncated, reading from the start")
+            f.seek(0)
+            partial = b""
+
+
+async def follow(filenames, parse, on_record, snapshot, interval=60, poll=1.0):
+    """Tail every log in filenames, handing each record parse(lines, state)
+    makes to on_record(filename, record). Call snapshot() every interval
+    seconds. Runs until cancelled"""
+
+    async def tail(filename):
+        state = {}
+        async for lines in follow_lines(filename, poll):
+            for record in parse(lines, state):
+                on_record(filename, record)
+
+    async def snapshots():
+        while True:
+            await asyncio.sleep(interval)
+            snapshot()
+
+    tasks = [asyncio.create_task(tail(filename)) for filename in filenames]
+    tasks.append(asyncio.create_task(snapshots()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        snapshot()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""On disk cache of Active Directory lookups, so reruns don't ask the
+   directory again for the same few hundred users.
+   SQLite table of (kind, key) -> entry JSON as AD.fetch returns it, with
+   when it expires. NULL entries remember "User Not Found" for a shorter
+   time. Offline, expired entries are still better than nothing"""
+import os
+import time
+import sqlite3
+import threading
+import metrics
+from logcache import cache_dir
+
+# Seconds an entry is good for, found and not found
+TTL = 7 * 24 * 3600
+NEGATIVE_TTL = 24 * 3600
+# Keys per query in get_many, under SQLite's variable limit
+QUERY_BATCH = 500
+
+
+class IdentityCache:
+    """(kind, key) -> entry JSON or None for not found. Keys are matched
+    without case, as AD does. Safe to share between threads"""
+
+    def __init__(self, path=None, ttl=TTL, negative_ttl=NEGATIVE_TTL):
+        self.path = path or os.path.join(cache_dir(), "identities.sqlite")
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS identity ("
+                "kind TEXT, key TEXT, entry TEXT, expires REAL, "
+                "PRIMARY KEY (kind, key))"
+            )
+
+    def get(self, kind, key, stale=False):
+        """Return (hit, entry). entry None on a hit means not found
+        stale: take expired entries too, when we can't ask the directory"""
+        found = self.get_many(kind, [key], stale)
+        key = str(key).lower()
+        return (key in found, found.get(key))
+
+    def get_many(self, kind, keys, stale=False):
+        """Return dict of lower case key -> entry for the keys cached"""
+        keys = list(dict.fromkeys(str(key).lower() for key in keys))
+        now = 0 if stale else time.time()
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), QUERY_BATCH):
+                batch = keys[start : start + QUERY_BATCH]
+                rows = self.db.execute(
+                    "SELECT key, entry FROM identity WHERE kind = ? AND expires > ? "
+                    f"AND key IN ({','.join('?' * len(batch))})",
+                    [kind, now, *batch],
+                )
+                found.update(rows)
+            metrics.count("identity_cache_hits", len(found))
+            metrics.count("identity_cache_misses", len(keys) - len(found))
+        return found
+
+    def put(self, kind, key, entry):
+        """Remember entry (None: not found) for key"""
+        self.put_many(kind, {key: entry})
+
+    def put_many(self, kind, entries):
+        """Remember dict of key -> entry (None: not found)"""
+        now = time.time()
+        rows = [
+            (
+                kind,
+                str(key).lower(),
+                entry,
+                now + (self.ttl if entry is not None else self.negative_ttl),
+            )
+            for key, entry in entries.items()
+        ]
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO identity VALUES (?, ?, ?, ?)", rows
+            )
+
+    def purge(self):
+        """Drop expired entries"""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM identity WHERE expires <= ?", [time.time()])
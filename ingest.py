@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Streaming ingestion of parsed log records into a DataFrame.
+   Records are pulled from a log_parse generator straight into columns,
+   so the raw log and a list of every record are never held in memory
+
+   Columns given a dtype are stored compactly as they are read:
+   "category" columns are dictionary encoded (interned value -> int code),
+   integer columns go into typed arrays. Anything else is gathered in
+   fixed size chunks of objects
+
+   Several logs (rotated, optionaly compressed) are parsed one per worker
+   process and their records concatenated in order. One big log can be
+   mmapped and split into line aligned byte ranges parsed the same way"""
+import os
+import bz2
+import glob
+import gzip
+import lzma
+import mmap
+import itertools
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Records per chunk before an object column is packed into an array
+CHUNK_SIZE = 65536
+
+# array typecodes for the integer dtypes we store
+TYPECODES = {"int8": "b", "int16": "h", "int32": "i", "int64": "q"}
+
+# Compressed logs are opened by extension
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+# Logs this big are split between worker processes
+SPLIT_SIZE = 64 << 20
+# Bytes of a range decoded at a time
+BLOCK_SIZE = 16 << 20
+
+
+class CategoryColumn:
+    """Dictionary encoded column: each new value gets the next code"""
+
+    def __init__(self):
+        self.codes = array("i")
+        self.lookup = {}
+
+    def append(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            if value is None:
+                code = -1
+            else:
+                code = self.lookup[value] = len(self.lookup)
+        self.codes.append(code)
+
+    def build(self):
+        """Return pd.Categorical, categories sorted so groupby and
+        sort_values order the same as they did on strings"""
+        codes = np.frombuffer(self.codes, dtype=np.int32)
+        categories = np.array(list(self.lookup), dtype=object)
+        order = np.argsort(categories, kind="stable")
+        # Re-number codes to the sorted categories, -1 stays missing
+        remap = np.empty(len(order) + 1, dtype=np.int32)
+        remap[order] = np.arange(len(order), dtype=np.int32)
+        remap[-1] = -1
+        return pd.Categorical.from_codes(
+            remap[codes], categories=pd.Index(categories[order], dtype=object)
+        )
+
+
+class IntegerColumn:
+    """Integer column in a typed array"""
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.values = array(TYPECODES[dtype])
+        self.append = self.values.append
+
+    def build(self):
+        return np.frombuffer(self.values, dtype=self.dtype)
+
+
+class ObjectColumn:
+    """Column of anything else, packed into an object array per chunk"""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.chunks = []
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) == self.chunk_size:
+            self.chunks.append(np.array(self.buffer, dtype=object))
+            self.buffer = []
+
+    def build(self):
+        if self.buffer or not self.chunks:
+            self.chunks.append(np.array(self.buffer, dtype=object))
+            self.buffer = []
+        values = np.concatenate(self.chunks)
+        self.chunks.clear()
+        return values
+
+
+def records_to_dataframe(records, columns, dtypes=None, chunk_size=CHUNK_SIZE):
+    """Consume records (iterable of sequences) into columns
+    dtypes maps column name to "category" or an integer dtype
+    Return DataFrame with one column per name in columns"""
+    dtypes = dtypes or {}
+    builders = []
+    for name in columns:
+        dtype = dtypes.get(name)
+        if dtype == "category":
+            builders.append(CategoryColumn())
+        elif dtype in TYPECODES:
+            builders.append(IntegerColumn(dtype))
+        else:
+            builders.append(ObjectColumn(chunk_size))
+    width = len(columns)
+    appends = [builder.append for builder in builders]
+
+    for record in records:
+        if len(record) > width:
+            raise ValueError(f"{width} columns passed, record had {len(record)}")
+        for append, value in zip(appends, record):
+            append(value)
+        # Short records are padded with None as from_records would
+        for append in appends[len(record) :]:
+            append(None)
+
+    data = {name: builder.build() for name, builder in zip(columns, builders)}
+    df = pd.DataFrame(data, columns=columns, copy=False)
+    # Same dtypes from_records would have inferred for untyped columns
+    untyped = [name for name in columns if name not in dtypes]
+    if untyped:
+        df[untyped] = df[untyped].infer_objects()
+    return df
+
+
+def counted(lines, tally):
+    """Yield lines, adding how many went by to tally["lines_read"]"""
+    read = 0
+    try:
+        for read, line in enumerate(lines, 1):
+            yield line
+    finally:
+        tally["lines_read"] += read
+
+
+def lines_read(df):
+    """Lines read to make the records in df, see parse_file"""
+    return df.attrs.get("lines_read", 0)
+
+
+def concat_records(frames):
+    """Concatenate record frames in order, merging their categories"""
+    if len(frames) == 1:
+        return frames[0]
+    data = {}
+    for name in frames[0].columns:
+        if isinstance(frames[0][name].dtype, pd.CategoricalDtype):
+            merged = union_categoricals(
+                [df[name] for df in frames], sort_categories=True
+            )
+            # Keep object categories as CategoryColumn builds them
+            data[name] = pd.Categorical.from_codes(
+                merged.codes,
+                categories=pd.Index(merged.categories.to_numpy(), dtype=object),
+            )
+        else:
+            data[name] = np.concatenate([df[name].to_numpy() for df in frames])
+    df = pd.DataFrame(data, columns=frames[0].columns, copy=False)
+    df.attrs["lines_read"] = sum(lines_read(frame) for frame in frames)
+    return df
+
+
+def open_log(filename):
+    """Open plain, gzip, bz2 or xz log for reading text"""
+    opener = OPENERS.get(os.path.splitext(filename)[1], open)
+    return opener(filename, "rt", encoding="utf-8", errors="ignore")
+
+
+def is_compressed(filename):
+    """Is this a log we decompress as we read"""
+    return os.path.splitext(filename)[1] in OPENERS
+
+
+def expand_logs(paths):
+    """Files to read for the paths given: directories and globs are
+    expanded. Oldest first by modification time, so rotated logs
+    (lmgrd.log.2.gz, lmgrd.log.1, lmgrd.log) come in the order written"""
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = [os.path.join(path, name) for name in os.listdir(path)]
+        elif glob.has_magic(path):
+            found = glob.glob(path)
+        else:
+            found = [path]
+        filenames.extend(name for name in found if not os.path.isdir(name))
+    if not filenames:
+        raise ValueError(f"No log files found in {' '.join(paths)}")
+    return sorted(set(filenames), key=lambda name: (os.path.getmtime(name), name))
+
+
+def parse_lines(lines, parse, columns, dtypes=None):
+    """Records parse() makes of lines, with how many lines there were
+    in attrs, as they come back from worker processes"""
+    tally = {"lines_read": 0}
+    df = records_to_dataframe(parse(counted(lines, tally)), columns, dtypes)
+    df.attrs["lines_read"] = tally["lines_read"]
+    return df
+
+
+def parse_file(filename, parse, columns, dtypes=None):
+    """Records parse() makes of one (maybe compressed) log file"""
+    with open_log(filename) as f:
+        return parse_lines(f, parse, columns, dtypes)
+
+
+def parse_files(filenames, parse, columns, dtypes=None, jobs=None):
+    """Parse each log in its own worker process, one file per worker
+    parse must pickle, e.g. functools.partial of a module level log_parse
+    Return the records of all the files concatenated in filenames order"""
+    if len(filenames) == 1:
+        return parse_file(filenames[0], parse, columns, dtypes)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        frames = list(
+            pool.map(
+                parse_file,
+                filenames,
+                itertools.repeat(parse),
+                itertools.repeat(columns),
+                itertools.repeat(dtypes),
+            )
+        )
+    return concat_records(frames)
+
+
+def split_ranges(filename, parts):
+    """Split filename into up to parts (start, end) byte ranges, each
+    ending just after a newline"""
+    with open(filename, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        size = len(mm)
+        bounds = [0]
+        for part in range(1, parts):
+            newline = mm.find(b"\n", max(size * part // parts, bounds[-1]))
+            if newline < 0:
+                break
+            bounds.append(newline + 1)
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def read_range(filename, start, end):
+    """Yield the lines in byte range start:end of filename, decoding a
+    block at a time out of an mmap"""
+    with open(filename, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        while start < end:
+            stop = min(start + BLOCK_SIZE, end)
+            if stop < end:
+                # Don't split a line between blocks
+                stop = mm.rfind(b"\n", start, stop) + 1 or stop
+            text = mm[start:stop].decode("utf-8", errors="ignore")
+            yield from text.splitlines(True)
+            start = stop
+
+
+def parse_range(filename, start, end, parse, columns, dtypes=None):
+    """Records parse() makes of one byte range of filename"""
+    return parse_lines(read_range(filename, start, end), parse, columns, dtypes)
+
+
+def parse_large_file(filename, parse, columns, dtypes=None, jobs=None):
+    """Parse one big log in line aligned byte ranges, one per worker
+    Records come back as columnar frames and are concatenated in file
+    order. Anything that depends on the lines before a range (the lmgrd
+    date) has to be resolved afterwards"""
+    jobs = jobs or os.cpu_count() or 1
+    ranges = split_ranges(filename, jobs)
+    if len(ranges) == 1:
+        return parse_range(filename, *ranges[0], parse, columns, dtypes)
+    starts, ends = zip(*ranges)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        frames = list(
+            pool.map(
+                parse_range,
+                itertools.repeat(filename),
+                starts,
+                ends,
+                itertools.repeat(parse),
+                itertools.repeat(columns),
+                itertools.repeat(dtypes),
+            )
+        )
+    return concat_records(frames)
+
+
+def is_large(filename, jobs=None):
+    """Should this single log be split between workers"""
+    if is_compressed(filename) or not os.path.getsize(filename):
+        return False
+    if jobs is not None:
+        return jobs > 1
+    return os.path.getsize(filename) >= SPLIT_SIZE and (os.cpu_count() or 1) > 1
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Parse license server debug logs of any vendor in vendors/.
+   Show graphics of useage and availability of license
+   The format is told from the head of the log unless --format is given,
+   after that every vendor goes the same way: parse, slice, pair, report"""
+import os
+import re
+import argparse
+import sys
+import datetime
+import functools
+import pandas as pd
+import logcache
+import metrics
+import rollup
+import timeindex
+import vendors
+from ingest import (
+    parse_lines,
+    lines_read,
+    read_range,
+    parse_files,
+    parse_large_file,
+    expand_logs,
+    is_compressed,
+    is_large,
+)
+from pairing import pair_sessions
+import batch
+
+
+# Set ISO 8601 Datetime format e.g. 2020-12-22T14:30
+DT_FORMAT = "%Y-%m-%dT%H:%M"
+# Kinds of file a report can write, and those it does unless told
+OUTPUTS = ("csv", "xlsx", "png", "html")
+DEFAULT_OUTPUTS = ("csv", "xlsx", "png")
+
+
+def readfile_to_dataframe(fmt, window=None, recent=False, **kwargs):
+    """Read in file(s) of format fmt, return dataframe indexed by Date
+    window: (start, end) datetimes, only the part of the log with records
+    between them need be read, found with its time index (timeindex.py)
+    recent: the window runs up to now (--dur alone), scan back from the end
+    of the log for its start if there's no index yet"""
+    filename = kwargs.get("filename")
+    filenames = kwargs.get("filenames") or [filename]
+    with metrics.stage("parse"):
+        if len(filenames) > 1 or is_compressed(filename):
+            # Rotated and compressed logs, one per worker process
+            df = parse_files(
+                filenames,
+                functools.partial(fmt.log_parse, rotated=True, **kwargs),
+                fmt.columns,
+                fmt.dtypes,
+                kwargs.get("jobs"),
+            )
+        elif kwargs.get("cache"):
+            # Only parse what has been appended since the last run
+            df = logcache.cached_records(
+                filename,
+                lambda lines, state: fmt.log_parse(lines, state=state, **kwargs),
+                fmt.columns,
+                fmt.dtypes,
+                tag=fmt.cache_tag(**kwargs),
+            )
+        elif window:
+            # Just the bytes of the window, from a line with its date
+            first, last, when = timeindex.byte_range(
+                fmt, *window, recent=recent, **kwargs
+            )
+            metrics.count("bytes_skipped", os.path.getsize(filename) - (last - first))
+            state = {"date": when.date().isoformat()} if when else None
+            df = parse_lines(
+                read_range(filename, first, last),
+                functools.partial(fmt.log_parse, state=state, **kwargs),
+                fmt.columns,
+                fmt.dtypes,
+            )
+        elif is_large(filename, kwargs.get("jobs")):
+            # One big log, split into line aligned byte ranges per worker process
+            df = parse_large_file(
+                filename,
+                functools.partial(fmt.log_parse, rotated=True, **kwargs),
+                fmt.columns,
+                fmt.dtypes,
+                kwargs.get("jobs"),
+            )
+        else:
+            # Stream the file through the parser, no readlines() copy
+            with open(filename, "rt", encoding="utf-8", errors="ignore") as f:
+                df = parse_lines(
+                    f,
+                    functools.partial(fmt.log_parse, **kwargs),
+                    fmt.columns,
+                    fmt.dtypes,
+                )
+    metrics.count("lines_read", lines_read(df))
+    metrics.count("lines_kept", len(df))
+    with metrics.stage("dates"):
+        df = fmt.dates(df, **kwargs)
+        df.drop(list(fmt.discard), axis=1, inplace=True)
+        df = df.set_index(pd.DatetimeIndex(df["Date"]))
+        if len(filenames) > 1:
+            # Merge the logs into time order
+            df = df.sort_index(kind="stable")
+    return df
+
+
+def pair(fmt, df_sub, end=None):
+    """Events table of the sessions in df_sub, and the refusals
+    Checkins go on into the overrun, checkouts and refusals stop at end"""
+    # Split Checkout and checkin events: record refusals too
+    df_sub_in = df_sub[df_sub["Action"].isin(fmt.checkin)]
+    if end:
+        df_sub = df_sub.loc[:end]
+    df_sub_out = df_sub[df_sub["Action"].isin(fmt.checkout)]
+    df_sub_ref = df_sub[df_sub["Action"].isin(fmt.denied)]
+
+    # Events table: For every checkout get checkin; calculate the loan duration
+    events = pair_sessions(df_sub_out, df_sub_in, keys=fmt.keys, columns=fmt.sessions)
+    return events, df_sub_ref
+
+
+def simple_user(users, offline=False):
+    """ Take a column of user logon ids and return it with their names
+    Only the unique ids are looked up, from the identity cache and then
+    batched into a few AD searches. Offline only the cache is asked """
+    import ADlookup as ad  # Only needed with -a
+
+    users = users.astype("category")
+    names = ad.AD(offline=offline).display_names(list(users.cat.categories))
+    # User Not Found keeps the original uid
+    return users.map(lambda uid: names.get(uid, uid)).astype("category")
+
+
+def cmd_args(args=None):
+    """Prepare commandline arguments return Namespace object of options set"""
+    parser = argparse.ArgumentParser("Prepares license log for datamining.")
+
+    parser.add_argument(
+        "filename",
+        nargs="*",
+        help="path/filename of logfile(s) to parse: files, directories or globs, "
+        "rotated and .gz/.bz2/.xz logs are merged. None with --rollup to report "
+        "from the rollup alone",
+    )
+    parser.add_argument(
+        "-F",
+        "--format",
+        dest="format",
+        choices=list(vendors.FORMATS),
+        help="Log format, default: told from the first few KB of the log",
+    )
+    parser.add_argument(
+        "-i", "--hint", dest="hint", help="Hint start date of the log YYYY-MM-DD"
+    )
+    parser.add_argument(
+        "-s",
+        "--start",
+        dest="start",
+        help="Start date YYYY-MM-DDTHH:MM e.g 2020-03-23T13:24",
+    )
+    parser.add_argument("-e", "--end", dest="end", help="End   date YYYY-MM-DDTHH:MM")
+    parser.add_argument(
+        "-d",
+        "--dur",
+        dest="dur",
+        help="Duration: Hours, Days, Weeks,  e.g. 2W for 2 weeks",
+    )
+    parser.add_argument(
+        "-f",
+        "--follow",
+        dest="follow",
+        action="store_true",
+        help="Follow the logs as they grow, snapshot outputs every --interval",
+    )
+    parser.add_argument(
+        "--interval",
+        dest="interval",
+        type=int,
+        default=60,
+        help="Seconds between snapshots when following, default 60",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        help="Worker processes for several or very big logs and --every reports, "
+        "default one per CPU",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        dest="cache",
+        action="store_true",
+        help="Cache parsed log, only parse lines added since the last run",
+    )
+    parser.add_argument(
+        "--every",
+        dest="every",
+        help="Report each window of the range into its own directory: Hours, Days, "
+        "Weeks, Months or Years e.g. 1M for monthly reports",
+    )
+    parser.add_argument(
+        "--html",
+        dest="html",
+        action="store_true",
+        help="Also write a single HTML page to pan and zoom the sessions in a browser",
+    )
+    parser.add_argument(
+        "--outputs",
+        dest="outputs",
+        help="Files to write, comma separated from csv, xlsx, png and html, "
+        "default csv,xlsx,png. Without png nothing is drawn",
+    )
+    parser.add_argument(
+        "--no-graph",
+        dest="no_graph",
+        action="store_true",
+        help="Tables only, don't draw the graph",
+    )
+    parser.add_argument(
+        "--metrics",
+        dest="metrics",
+        help="Append time, CPU, peak memory and counts of each stage to METRICS "
+        "as NDJSON, or write them as one document if it ends .json",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="Profile each stage, print the slowest and write it to "
+        "licvis-STAGE.prof",
+    )
+    parser.add_argument(
+        "--rollup",
+        dest="rollup",
+        help="Add the sessions to the hourly usage rollup in directory ROLLUP. "
+        "With no log the report of --start/--end comes from it instead",
+    )
+    parser.add_argument(
+        "--capacity",
+        dest="capacity",
+        action="store_true",
+        help="Capacity report: time weighted percentiles of licenses in use, "
+        "by hour of day, and the busiest windows",
+    )
+    parser.add_argument(
+        "--seats",
+        dest="seats",
+        type=int,
+        help="Seats in the pool, capacity report counts minutes at or above it",
+    )
+    parser.add_argument(
+        "-a",
+        "--Active-Directory",
+        dest="active_directory",
+        action="store_true",
+        help="Resolve user ID to real name  in Active Directory",
+    )
+    parser.add_argument(
+        "--offline",
+        dest="offline",
+        action="store_true",
+        help="With -a only use names cached by earlier runs, don't ask AD",
+    )
+
+    opt = parser.parse_args(args)
+    return opt
+
+
+def process_opts(opt):
+    """Process cmdline options logic
+    Calculate ROI start and end times from combinations supplied"""
+    kwargs = {}
+    if not opt.filename and not opt.rollup:
+        raise ValueError("No log to read, nor a --rollup to report from")
+    if opt.filename:
+        filenames = opt.filename if opt.follow else expand_logs(opt.filename)
+        kwargs = {"filename": filenames[0], "filenames": filenames, **kwargs}
+
+    if opt.dur:
+        # If set get timedelta it represents
+        duration = parse_duration(opt.dur)
+        print(f"Duration {opt.dur}")
+
+    if opt.dur and opt.start and opt.end:
+        # Assume start and range ignore end
+        opt.end_dt = date_to_dt(opt.start, DT_FORMAT) + duration
+        opt.end = opt.end_dt.strftime(DT_FORMAT)
+
+    if opt.dur and opt.start and not opt.end:
+        # Start and range
+        opt.end_dt = date_to_dt(opt.start, DT_FORMAT) + duration
+        opt.end = opt.end_dt.strftime(DT_FORMAT)
+
+    if opt.dur and not opt.start and opt.end:
+        # Range before enddate
+        opt.start_dt = date_to_dt(opt.end, DT_FORMAT) - duration
+        opt.start = opt.start_dt.strftime(DT_FORMAT)
+
+        # This won't return the full duration until we know the end date in our log
+    # The last --dur before now, nothing said about where
+    opt.recent = bool(opt.dur and not opt.start and not opt.end)
+    if opt.dur and not opt.start and not opt.end:
+        # End of log back by duration
+        opt.end_dt = datetime.datetime.now()
+        opt.end = dt_to_date(opt.end_dt, DT_FORMAT)
+        opt.start_dt = date_to_dt(opt.end, DT_FORMAT) - duration
+        opt.start = opt.start_dt.strftime(DT_FORMAT)
+
+    if not opt.dur and opt.start and opt.end:
+        # Date range
+        if date_to_dt(opt.start, DT_FORMAT) > date_to_dt(opt.end, DT_FORMAT):
+            # End before start so swap
+            opt.start, opt.end = opt.end, opt.start
+
+    if not opt.dur and opt.start and not opt.end:
+        # Start Date only - from start date to end
+        opt.end_dt = datetime.datetime.now()
+        opt.end = opt.end_dt.strftime(DT_FORMAT)
+
+    if not opt.dur and not opt.start and opt.end:
+        # End Date only - from end date to start
+        opt.start_dt = datetime.date(1970, 1, 1)
+        opt.start = opt.start_dt.strftime(DT_FORMAT)
+
+    # Files the report writes: without png there is no plotting at all
+    outputs = DEFAULT_OUTPUTS
+    if opt.outputs:
+        outputs = [kind.strip().lower() for kind in opt.outputs.split(",")]
+        if not set(outputs) <= set(OUTPUTS):
+            raise ValueError(f"--outputs {opt.outputs} isn't from {','.join(OUTPUTS)}")
+    opt.outputs = set(outputs)
+    if opt.html:
+        opt.outputs.add("html")
+    if opt.no_graph:
+        opt.outputs.discard("png")
+
+    if opt.hint:
+        # Hint is for timestamping log before first timestsmp
+        current_date = opt.hint
+        kwargs = {"hint": current_date, **kwargs}
+
+    if opt.jobs:
+        # Worker processes for rotated logs
+        kwargs = {"jobs": opt.jobs, **kwargs}
+
+    if opt.cache:
+        # Keep parsed records between runs
+        kwargs = {"cache": True, **kwargs}
+
+    if opt.active_directory:
+        # Resolve uid to realname in Active Directory
+        kwargs = {"active_directory": True, **kwargs}
+
+    if opt.offline:
+        # Names from the identity cache only
+        kwargs = {"offline": True, **kwargs}
+
+    return kwargs
+
+
+def parse_duration(duration):
+    """Parse duration Hours,Days or Weeks Return timedelta"""
+    hours = datetime.timedelta(hours=1)
+    days = datetime.timedelta(days=1)
+    weeks = datetime.timedelta(weeks=1)
+    fields = re.split(r"(\d+)", duration)
+    duration = int(fields[1])
+    if fields[2][:1].upper() == "H":
+        duration_td = duration * hours
+    elif fields[2][:1].upper() == "D":
+        duration_td = duration * days
+    elif fields[2][:1].upper() == "W":
+        duration_td = duration * weeks
+    else:
+        raise ValueError
+
+    return duration_td
+
+
+def date_to_dt(datestring, FORMAT):
+    """Convert date string to datetime object"""
+    dateasdt = datetime.datetime.strptime(datestring, FORMAT)
+    return dateasdt
+
+
+def dt_to_date(dateasdt, FORMAT):
+    """Convert datetime object to datestring"""
+    datestring = datetime.datetime.strftime(dateasdt, FORMAT)
+    return datestring
+
+
+def main(args=None):
+    """Start of main function"""
+    opt = cmd_args(args)
+    run = metrics.start(profile=opt.profile)
+    kwargs = process_opts(opt)
+    if not kwargs.get("filenames"):
+        # Nothing to parse, the tables come from the rollup
+        rollup_report(opt)
+        write_metrics(run, opt, rollup=opt.rollup)
+        return
+    if opt.format:
+        fmt = vendors.get(opt.format)
+    else:
+        fmt = vendors.detect(kwargs["filename"])
+        print(f"==Reading {fmt.name} log==")
+    if opt.follow:
+        # Live: keep sessions current rather than a batch run
+        fmt.follow_logs(interval=opt.interval, opt=opt, **kwargs)
+        return
+    window = None
+    if opt.start:
+        # Add some time to find the end of sessions just started within our slice
+        opt.endExtra = date_to_dt(opt.end, DT_FORMAT) + fmt.overrun
+        opt.endExtra = dt_to_date(opt.endExtra, DT_FORMAT)
+        # Only that part of the log is read, to the end of endExtra's minute
+        window = (
+            pd.Timestamp(opt.start).to_pydatetime(),
+            date_to_dt(opt.endExtra, DT_FORMAT) + datetime.timedelta(minutes=1),
+        )
+    df = readfile_to_dataframe(fmt, window, opt.recent, **kwargs)
+
+    # Select observations between two datetimes
+    if opt.start:
+        df_sub = df.loc[opt.start : opt.endExtra].copy()
+    else:
+        df_sub = df  # or use the whole dataset
+
+    # Enable for AD lookup of User's real name
+    if kwargs.get("active_directory"):
+        with metrics.stage("resolve"):
+            df_sub["User"] = simple_user(df_sub["User"], kwargs.get("offline"))
+
+    # Unique users in time range
+    print(f"==Number of users: {df_sub.User.nunique()} ==")
+    print("==Unique Users==")
+    print(df_sub.User.unique())
+
+    with metrics.stage("pair"):
+        df_sub, loans = fmt.library(df_sub)
+        events, df_sub_ref = pair(fmt, df_sub, opt.end)
+
+    if opt.rollup:
+        with metrics.stage("rollup"):
+            rollup.update(opt.rollup, fmt, events, df_sub_ref, opt.start, opt.end)
+
+    if opt.every:
+        # Parsed and paired once, a report per window
+        first, last = batch.span(events, opt.start, opt.end)
+        with metrics.stage("reports"):
+            batch.write_reports(
+                fmt.report,
+                batch.windows(opt.every, first, last),
+                events,
+                df_sub_ref,
+                loans=loans,
+                jobs=kwargs.get("jobs"),
+                opt=opt,
+            )
+    else:
+        # The page is there to look at, only save the graph then
+        show = fmt.show and "html" not in opt.outputs
+        fmt.report(events, df_sub_ref, opt, loans=loans, show=show)
+
+    write_metrics(run, opt, format=fmt.name, files=kwargs["filenames"])
+
+
+def write_metrics(run, opt, **details):
+    """--profile and --metrics output of the run"""
+    if opt.profile:
+        run.dump_profile()
+    if opt.metrics:
+        run.write(opt.metrics, **details)
+
+
+def rollup_report(opt):
+    """Tables of the --start/--end window from the --rollup, no log read"""
+    with metrics.stage("rollup"):
+        cube = rollup.Rollup.load(opt.rollup)
+        if cube is None:
+            raise ValueError(f"No rollup in {opt.rollup}, give a log to build it")
+        if opt.format and opt.format != cube.format:
+            raise ValueError(f"{opt.rollup} is a rollup of {cube.format} logs")
+        window = cube.window(opt.start, opt.end)
+    print(f"==Rollup of {cube.format} logs {opt.start or ''} to {opt.end or ''}==")
+    with metrics.stage("aggregate"):
+        vendors.get(cube.format).rollup_tables(window, opt)
+
+
+def cli(args):
+    """main() with what was asked for gone wrong printed, not raised"""
+    try:
+        main(args)
+    except ValueError as e:
+        print(f"Give me something to do. {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli(sys.argv[1:])
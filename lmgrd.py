@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Tokenizer for lmgrd (Flexlm) debug log lines.
+   Shared by flexlm-vis.py and geneious-vis.py
+
+   16:07:10 (app-name) OUT: "floating_license" fbloggs@gbpcx5cg90224lt
+   15:06:29 (ACME) OUT: "ROCK_KIT" wcyote@GBAZL5CG8343SD5  (4 licenses)
+   16:06:37 (app-name) TIMESTAMP 4/8/2019
+"""
+import re
+import datetime
+import numpy as np
+
+# Date ordinal of the unix epoch, stamps are kept as days since then
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+EPOCH = datetime.datetime(1970, 1, 1)
+# Stamp of records seen before we know the date, see fill_unknown_stamps
+UNKNOWN_STAMP = -1
+
+ACTIONS = ("IN:", "OUT:", "DENIED:", "QUEUED:", "DEQUEUED:")
+
+# time, product, action, feature, user, host (up to the first dot)
+EVENT_LINE = re.compile(
+    r"\s*(\d+):(\d\d):(\d\d) (\([^)]*\)) "
+    r"(IN:|OUT:|DENIED:|QUEUED:|DEQUEUED:) "
+    r"(\S+) ([^@\s]*)@?([^.\s]*)"
+)
+TIMESTAMP_LINE = re.compile(r"\s*\S+ (\([^)]*\)) TIMESTAMP (\d+)/(\d+)/(\d+)")
+TOKEN_COUNT = re.compile(r"\s\((\d+) licenses\)")
+
+
+def parse_events(lines, current_date, product=None, tokens=False, state=None):
+    """Tag every event line with the date of the last TIMESTAMP line
+    and its seconds since midnight. Optionaly only keep lines from one product
+    Yield [Stamp, Seconds, Product, Action, Module, User, Host(, Tokens)]
+    Stamp is days since 1970-01-01, see rebuild_dates for the real date
+    current_date None: the date isn't known until the first TIMESTAMP,
+    records before it get UNKNOWN_STAMP
+    If given, state["date"] follows the current date so we can resume"""
+    if isinstance(current_date, datetime.datetime):
+        current_date = current_date.date()
+    stamp = UNKNOWN_STAMP
+    if current_date is not None:
+        stamp = current_date.toordinal() - EPOCH_ORDINAL
+    if state is not None:
+        state["date"] = current_date and current_date.isoformat()
+
+    for line in lines:
+        # Cheap rejection: event and TIMESTAMP lines have the keyword
+        # straight after the closing bracket of the product
+        close = line.find(") ", 0, 96)
+        if close < 0:
+            continue
+        keyword = line[close + 2 : close + 12]
+
+        if keyword.startswith(ACTIONS):
+            match = EVENT_LINE.match(line)
+            if match is None:
+                continue
+            hh, mm, ss, prod, action, module, user, host = match.groups()
+            if product and prod != product:
+                continue
+            data = [
+                stamp,
+                int(hh) * 3600 + int(mm) * 60 + int(ss),
+                prod,
+                action,
+                module,
+                user,
+                host,
+            ]
+            if tokens:
+                # Look for number of licenses used, assume 1 if more not shown
+                count = 1
+                if "licenses)" in line:
+                    if (found := TOKEN_COUNT.search(line, match.end())) is not None:
+                        count = int(found.group(1))
+                data.append(count)
+            yield data
+
+        elif keyword.startswith("TIMESTAMP"):
+            match = TIMESTAMP_LINE.match(line)
+            if match is None:
+                continue
+            prod, month, day, year = match.groups()
+            if product and prod != product:
+                continue
+            new_date = datetime.date(int(year), int(month), int(day))
+            # If it has changed, then that's the new value of current_date
+            if new_date != current_date:
+                current_date = new_date
+                stamp = current_date.toordinal() - EPOCH_ORDINAL
+                if state is not None:
+                    state["date"] = current_date.isoformat()
+                print(current_date)
+
+
+def fill_unknown_stamps(stamps, first_date):
+    """Records parsed before their log's first TIMESTAMP take the last
+    stamp before them, i.e. the date the previous log had reached.
+    Any at the very start get first_date"""
+    stamps = np.asarray(stamps, dtype=np.int64)
+    known = stamps != UNKNOWN_STAMP
+    if known.all():
+        return stamps
+    first = first_date.toordinal() - EPOCH_ORDINAL
+    # Index of the latest known stamp at or before each record
+    latest = np.maximum.accumulate(np.where(known, np.arange(len(stamps)), -1))
+    return np.where(latest >= 0, stamps[np.maximum(latest, 0)], first)
+
+
+def rebuild_dates(stamps, seconds):
+    """Turn TIMESTAMP day and seconds since midnight into datetimes.
+    Where the time of day goes backwards with no new TIMESTAMP the carriage
+    has become a pumpkin: midnight passed, so add a day from there on
+    Dates never go backwards. Return datetime64 array, rollovers fixed"""
+    stamps = np.asarray(stamps, dtype=np.int64)
+    seconds = np.asarray(seconds, dtype=np.int64)
+    new_stamp = np.ones(len(stamps), dtype=bool)
+    new_stamp[1:] = stamps[1:] != stamps[:-1]
+    step_back = np.zeros(len(stamps), dtype=bool)
+    step_back[1:] = (seconds[1:] < seconds[:-1]) & ~new_stamp[1:]
+
+    # Count the midnights passed since the last new TIMESTAMP date
+    rollovers = np.cumsum(step_back)
+    rollovers -= np.maximum.accumulate(np.where(new_stamp, rollovers, 0))
+    days = np.maximum.accumulate(stamps + rollovers)
+    dates = (days * 86400 + seconds).astype("datetime64[s]")
+    return dates.astype("datetime64[ns]"), int(step_back.sum())
+
+
+class DateRebuilder:
+    """rebuild_dates for records that arrive one at a time, as when
+    following a live log. Gives the same dates as the bulk version"""
+
+    def __init__(self):
+        self.stamp = None
+        self.seconds = 0
+        self.rollovers = 0
+        self.day = None
+
+    def __call__(self, stamp, seconds):
+        """Return datetime of record with this TIMESTAMP day and seconds"""
+        if stamp != self.stamp:
+            self.stamp = stamp
+            self.rollovers = 0
+        elif seconds < self.seconds:
+            print("AWOOGA!!! ALERT we have a pumpkin. Fixed rollover date")
+            self.rollovers += 1
+        self.seconds = seconds
+        day = stamp + self.rollovers
+        if self.day is not None and day < self.day:
+            day = self.day
+        self.day = day
+        return EPOCH + datetime.timedelta(days=day, seconds=seconds)
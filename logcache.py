@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""On disk cache of parsed log records.
+   License logs only ever grow, so a rerun loads the records parsed last
+   time and only parses the lines appended since. The cache remembers the
+   byte offset reached, the parser state at that point and a fingerprint
+   of the parsed part of the file; rotation or truncation forces a rebuild
+
+   Columns are stored in a numpy .npz, categoricals as codes + categories"""
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+import metrics
+from ingest import parse_lines, concat_records, lines_read
+
+# Bump when the stored layout or a parser's output changes
+CACHE_VERSION = 2
+# Bytes hashed at the start of the file and just before the offset reached
+FINGERPRINT_BYTES = 4096
+
+
+def cache_dir():
+    """Directory we keep caches in, honours XDG_CACHE_HOME"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "smokedweaselcheese")
+
+
+def cache_path(filename, tag, columns):
+    """Cache file for this log, parser (tag) and column layout"""
+    key = json.dumps([CACHE_VERSION, os.path.realpath(filename), tag, list(columns)])
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir(), f"{digest}.npz")
+
+
+def cached_records(filename, parse, columns, dtypes=None, tag=""):
+    """Return DataFrame of records parse() makes of filename, parsing only
+    what was appended since the cache was written. parse(lines, state)
+    must keep anything it needs to resume with in the dict state"""
+    path = cache_path(filename, tag, columns)
+    df, meta = load(path)
+    stat = os.stat(filename)
+
+    with open(filename, "rb") as f:
+        if meta is not None and not still_valid(f, stat, meta):
+            print("Log rotated or truncated since last run, rebuilding cache")
+            df, meta = None, None
+        if meta is None:
+            metrics.count("cache_misses")
+        else:
+            metrics.count("cache_hits")
+            metrics.count("cached_records", len(df))
+            # Lines the cached records came from, so lines_read covers them
+            df.attrs["lines_read"] = meta["lines_read"]
+        if meta is not None and meta["offset"] == stat.st_size:
+            # Nothing new in the log
+            return df
+
+        progress = {"offset": meta["offset"] if meta else 0}
+        state = meta["state"] if meta else {}
+        f.seek(progress["offset"])
+        tail = parse_lines(
+            read_lines(f, progress), lambda lines: parse(lines, state), columns, dtypes
+        )
+        df = tail if df is None else concat_records([df, tail])
+        meta = {
+            "device": stat.st_dev,
+            "inode": stat.st_ino,
+            "offset": progress["offset"],
+            "fingerprint": fingerprint(f, progress["offset"]),
+            "state": state,
+            "lines_read": lines_read(df),
+        }
+
+    save(path, df, meta)
+    return df
+
+
+def read_lines(f, progress):
+    """Yield decoded lines from binary file f, progress["offset"] follows
+    the end of the last whole line. A line still being written (no newline
+    yet) is left for next time"""
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            break
+        progress["offset"] += len(raw)
+        yield raw.decode("utf-8", errors="ignore")
+
+
+def fingerprint(f, offset):
+    """Hash the head of the file and the bytes just before offset"""
+    digest = hashlib.sha1()
+    f.seek(0)
+    digest.update(f.read(min(offset, FINGERPRINT_BYTES)))
+    f.seek(max(offset - FINGERPRINT_BYTES, 0))
+    digest.update(f.read(min(offset, FINGERPRINT_BYTES)))
+    return digest.hexdigest()
+
+
+def still_valid(f, stat, meta):
+    """Is this the same file we cached, with what we parsed unchanged"""
+    if (stat.st_dev, stat.st_ino) != (meta["device"], meta["inode"]):
+        return False
+    if stat.st_size < meta["offset"]:
+        return False
+    return fingerprint(f, meta["offset"]) == meta["fingerprint"]
+
+
+def save(path, df, meta, compress=False):
+    """Write columns and meta to path, atomically replacing the old cache
+    compress: zip them, for things kept a long time rather than reread"""
+    arrays = {}
+    kinds = {}
+    for number, name in enumerate(df.columns):
+        column = df[name]
+        if column.dtype.kind in "biuf":
+            kinds[name] = "values"
+            arrays[f"values_{number}"] = column.to_numpy()
+            continue
+        # Strings are stored dictionary encoded, like the categoricals
+        kinds[name] = "category"
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            kinds[name] = "object"
+            column = column.astype("category")
+        arrays[f"codes_{number}"] = column.cat.codes.to_numpy()
+        arrays[f"categories_{number}"] = column.cat.categories.to_numpy(dtype=str)
+    meta = {**meta, "columns": list(df.columns), "kinds": kinds}
+    arrays["meta"] = np.array(json.dumps(meta))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            (np.savez_compressed if compress else np.savez)(f, **arrays)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def load(path):
+    """Return cached DataFrame and meta, (None, None) if there is no
+    usable cache"""
+    try:
+        with np.load(path, allow_pickle=False) as cache:
+            meta = json.loads(cache["meta"][()])
+            data = {}
+            for number, name in enumerate(meta["columns"]):
+                kind = meta["kinds"][name]
+                if kind == "values":
+                    data[name] = cache[f"values_{number}"]
+                    continue
+                column = pd.Categorical.from_codes(
+                    cache[f"codes_{number}"],
+                    categories=pd.Index(cache[f"categories_{number}"], dtype=object),
+                )
+                data[name] = column if kind == "category" else np.asarray(column)
+    except (OSError, KeyError, ValueError) as e:
+        if os.path.exists(path):
+            print(f"Ignoring unreadable cache {path}: {e}")
+        return None, None
+    return pd.DataFrame(data, columns=meta["columns"], copy=False), meta
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Where a run's time and memory go, and what went through it.
+   Each stage of the pipeline (parse, dates, resolve, pair, aggregate,
+   export, render) is timed, wall and CPU, with the peak memory reached by
+   its end. A stage inside another is taken out of the outer one's times,
+   so the stages add up to the run. Counters keep the lines read and kept,
+   checkouts never checked in, rollovers fixed and cache hits
+
+   Modules count into the run under way, metrics.RUN, main() starts a new
+   one. Written with --metrics as NDJSON, a line per stage and one for the
+   run, or one JSON document if the file ends .json
+   With --profile every stage runs under its own cProfile, the slowest is
+   printed and dumped for snakeviz, pstats etc."""
+import os
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import datetime
+import contextlib
+import collections
+
+try:
+    import resource
+except ImportError:  # Windows, no peak memory
+    resource = None
+
+
+def peak_rss():
+    """Most memory this process, or one of its finished workers, has had
+    MB, None where we can't tell"""
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Bytes on macOS, KB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def cpu_time():
+    """CPU seconds of this process and its finished workers"""
+    user, system, children_user, children_system = os.times()[:4]
+    return user + system + children_user + children_system
+
+
+class Metrics:
+    """Stage times and counters of one run"""
+
+    def __init__(self, profile=False):
+        self.started = datetime.datetime.now()
+        self.wall = time.perf_counter()
+        self.cpu = cpu_time()
+        self.profile = profile
+        self.stages = {}  # name -> {"wall", "cpu", "peak_rss_mb", "calls"}
+        self.profiles = {}  # name -> cProfile.Profile
+        self.counters = collections.Counter()
+        self.running = []  # Stages entered and not left, innermost last
+
+    def count(self, counter, n=1):
+        """Add n to counter"""
+        self.counters[counter] += int(n)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the block as stage name, adding to earlier blocks of the
+        same name"""
+        entry = self.stages.setdefault(
+            name, {"wall": 0.0, "cpu": 0.0, "peak_rss_mb": None, "calls": 0}
+        )
+        outer = self.running[-1] if self.running else None
+        if outer and self.profile:
+            self.profiles[outer["name"]].disable()
+        frame = {"name": name, "inner_wall": 0.0, "inner_cpu": 0.0}
+        self.running.append(frame)
+        if self.profile:
+            self.profiles.setdefault(name, cProfile.Profile()).enable()
+        wall, cpu = time.perf_counter(), cpu_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, cpu_time() - cpu
+            if self.profile:
+                self.profiles[name].disable()
+            self.running.pop()
+            # Less the stages inside, they have their own
+            entry["wall"] += wall - frame["inner_wall"]
+            entry["cpu"] += cpu - frame["inner_cpu"]
+            entry["peak_rss_mb"] = peak_rss()
+            entry["calls"] += 1
+            if outer:
+                outer["inner_wall"] += wall
+                outer["inner_cpu"] += cpu
+                if self.profile:
+                    self.profiles[outer["name"]].enable()
+
+    def slowest(self):
+        """Name of the stage that took longest, None if there were none"""
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda name: self.stages[name]["wall"])
+
+    def summary(self, **details):
+        """The run as a whole: times, counters and details given"""
+        staged = sum(entry["wall"] for entry in self.stages.values())
+        wall = time.perf_counter() - self.wall
+        return {
+            "run": self.started.isoformat(timespec="seconds"),
+            **details,
+            "wall": wall,
+            "cpu": cpu_time() - self.cpu,
+            "unstaged_wall": max(wall - staged, 0.0),
+            "peak_rss_mb": peak_rss(),
+            "slowest": self.slowest(),
+            "counters": dict(self.counters),
+        }
+
+    def write(self, filename, **details):
+        """Stages and summary to filename: one JSON document if it ends
+        .json, else NDJSON lines appended, so runs build up a history"""
+        run = self.started.isoformat(timespec="seconds")
+        stages = [{"run": run, "stage": name, **e} for name, e in self.stages.items()]
+        summary = self.summary(**details)
+        if filename.endswith(".json"):
+            with open(filename, "w", encoding="utf8") as f:
+                json.dump({**summary, "stages": stages}, f, indent=2)
+            return
+        with open(filename, "a", encoding="utf8") as f:
+            for record in stages + [summary]:
+                f.write(json.dumps(record) + "\n")
+
+    def dump_profile(self, prefix="licvis", top=25):
+        """Print the slowest stage's profile, and write it for pstats
+        Return the filename, None if nothing was profiled"""
+        name = self.slowest()
+        if name is None or name not in self.profiles:
+            return None
+        filename = f"{prefix}-{name}.prof"
+        self.profiles[name].dump_stats(filename)
+        out = io.StringIO()
+        stats = pstats.Stats(self.profiles[name], stream=out)
+        stats.sort_stats("cumulative").print_stats(top)
+        print(f'==Profile of the slowest stage, {name}== output as "{filename}"')
+        print(out.getvalue())
+        return filename
+
+
+# The run under way
+RUN = Metrics()
+
+
+def start(profile=False):
+    """Begin a new run, counting from now"""
+    global RUN
+    RUN = Metrics(profile)
+    return RUN
+
+
+def count(counter, n=1):
+    """Add n to counter of the run under way"""
+    RUN.count(counter, n)
+
+
+def stage(name):
+    """Time the block as stage name of the run under way"""
+    return RUN.stage(name)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Pair license checkout events with their checkin.
+   Shared by all the *-vis.py scripts"""
+import numpy as np
+import pandas as pd
+import metrics
+
+
+def pair_sessions(df_sub_out, df_sub_in, keys, columns):
+    """For every checkout find its checkin for the same keys: the first
+    open on a key is the first closed, several can be open at once.
+    Return events table of LicOut, LicIn, Duration and the other
+    columns asked for, taken from the checkout row, in columns order"""
+    keys = list(keys)
+    # Checkouts in time order, checkin times carried as LicIn
+    outs = df_sub_out.reset_index(drop=True).rename(columns={"Date": "LicOut"})
+    outs = outs.dropna(subset=keys).sort_values("LicOut", kind="mergesort")
+    ins = df_sub_in[keys + ["Date"]].reset_index(drop=True)
+    ins = ins.rename(columns={"Date": "LicIn"}).dropna(subset=keys)
+    ins = ins.sort_values("LicIn", kind="mergesort")
+
+    # Checkouts and checkins of each key in time order, a checkout first
+    # when they're at the same time, so it can close on that checkin
+    group = (
+        pd.concat([outs[keys], ins[keys]], ignore_index=True)
+        .groupby(keys, sort=False, observed=True)
+        .ngroup()
+        .to_numpy()
+    )
+    moves = pd.DataFrame(
+        {
+            "Group": group,
+            "When": np.concatenate([outs.LicOut.to_numpy(), ins.LicIn.to_numpy()]),
+            "Step": np.repeat([1, -1], [len(outs), len(ins)]),
+            "Row": np.concatenate([np.arange(len(outs)), np.arange(len(ins))]),
+        }
+    )
+    moves = moves.sort_values(
+        ["Group", "When", "Step"], ascending=[True, True, False], kind="mergesort"
+    )
+    # A checkin with nothing open on its key (its checkout before the log or
+    # the slice) closes nothing: those are where the running count of open
+    # sessions would go below any low it has had
+    low = moves.Step.groupby(moves.Group).cumsum().groupby(moves.Group).cummin()
+    strays = (-low).clip(lower=0)
+    stray = strays > strays.groupby(moves.Group).shift(fill_value=0)
+    moves = moves[~stray]
+
+    # The rest pair first in, first out: the nth checkout of a key takes
+    # its nth checkin, one session each
+    moves = moves.assign(Rank=moves.groupby(["Group", "Step"]).cumcount())
+    pairs = moves[moves.Step == 1].merge(
+        moves[moves.Step == -1], on=["Group", "Rank"], how="left", suffixes=("", "In")
+    )
+    closed = np.full(len(outs), -1)
+    matched = pairs.RowIn.notna()
+    closed[pairs.Row[matched]] = pairs.RowIn[matched]
+    sessions = outs.reset_index(drop=True)
+    sessions["LicIn"] = ins.LicIn.reset_index(drop=True).reindex(closed).to_numpy()
+
+    unmatched = sessions.LicIn.isna()
+    metrics.count("unmatched_checkouts", unmatched.sum())
+    for row in sessions[unmatched].itertuples():
+        print(f"No MATCH! {row}")
+
+    events = sessions[~unmatched].reset_index(drop=True)
+    events["Duration"] = events.LicIn - events.LicOut
+    events = events[list(columns)]
+    events["LicOut"] = pd.to_datetime(events["LicOut"], utc=True)
+    events["LicIn"] = pd.to_datetime(events["LicIn"], utc=True)
+    events["Duration"] = pd.to_timedelta(events["Duration"])
+    return events
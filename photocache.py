@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Content addressed store of user photos (AD thumbnailPhoto) on disk.
+   Each photo is written once, named by the SHA-256 of its bytes, so
+   users sharing a photo or a photo fetched again unchanged cost nothing.
+   Which user has which photo is kept in the identity cache, see
+   ADlookup.AD.prefetch_thumbnails"""
+import os
+import hashlib
+import tempfile
+from logcache import cache_dir
+
+
+class PhotoCache:
+    """Photos by digest under directory, photos/ab/abcd....jpg"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(cache_dir(), "photos")
+
+    def path(self, digest):
+        """Where the photo with this digest lives"""
+        return os.path.join(self.directory, digest[:2], f"{digest}.jpg")
+
+    def has(self, digest):
+        return digest is not None and os.path.exists(self.path(digest))
+
+    def store(self, photo):
+        """Keep photo bytes, return their digest"""
+        digest = hashlib.sha256(photo).hexdigest()
+        if self.has(digest):
+            return digest
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".jpg")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(photo)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+        return digest
+
+    def read(self, digest):
+        """Photo bytes for digest"""
+        with open(self.path(digest), "rb") as f:
+            return f.read()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Usage rollup: sessions and refusals added up by hour, so the reports
+   of any window can be had again without parsing and pairing the log.
+   A cell per hour x User x Module (or Number) x site holds
+     Seconds    license seconds held in that hour (tokens if the format has them)
+     Duration   seconds of the sessions checked out in that hour, start to end
+     Checkouts  sessions checked out in that hour
+     Denials    refusals in that hour
+   Duration and Checkouts are counted at the checkout, as the events table
+   does, so the reports come out the same. Peak licenses in use per hour
+   don't add up over cells, they're kept alongside per site, module etc.
+   and for the whole pool
+
+   Stored in a directory as two compressed .npz (see logcache.save). A run
+   rebuilds the hours its log covers and keeps the rest: history builds up
+   past log rotation, sessions still open are counted the run after they
+   close. A --start/--end run only rebuilds the hours it has whole, see
+   update().
+   Windows are whole hours, the start and end given widen to the hours
+   they fall in"""
+import os
+import datetime
+import numpy as np
+import pandas as pd
+import concurrency
+import logcache
+from ingest import concat_records
+
+HOUR = 3600
+TOTALS = ["Seconds", "Duration", "Checkouts", "Denials"]
+CELL_TYPES = {name: "int32" for name in ["Hour", *TOTALS]}
+# Whole sessions can add up past int32 seconds
+CELL_TYPES["Duration"] = "int64"
+PEAK_TYPES = {"Hour": "int32", "Peak": "int32"}
+
+
+def epoch_seconds(when):
+    """Seconds since 1970 of when, timezone aware times as naive UTC"""
+    return concurrency.as_datetimes(when).astype("datetime64[s]").astype(np.int64)
+
+
+def as_dimension(frame, name):
+    """Column name of frame as strings, "" where frame hasn't got it"""
+    if name not in frame:
+        return np.full(len(frame), "", dtype=object)
+    return frame[name].astype(str).to_numpy()
+
+
+def as_category(values):
+    """Categorical of values with object categories, as logcache.load
+    gives them back, so the old and new merge"""
+    codes, categories = pd.factorize(np.asarray(values, dtype=object), sort=True)
+    return pd.Categorical.from_codes(codes, pd.Index(categories, dtype=object))
+
+
+def cells(events, denied, by, tokens=None):
+    """Cells (Hour, *by, TOTALS) of the sessions in an events table and
+    the refusals in denied (indexed by Date)"""
+    start = epoch_seconds(events.LicOut)
+    end = np.maximum(epoch_seconds(events.LicIn), start)
+    held = np.ones(len(events), dtype=np.int64)
+    if tokens:
+        held = events[tokens].to_numpy(dtype=np.int64)
+
+    # A piece of each session per hour it spans
+    first, last = start // HOUR, np.maximum(end - 1, start) // HOUR
+    pieces = last - first + 1
+    row = np.repeat(np.arange(len(events)), pieces)
+    # Hours into its session of each piece
+    offset = np.arange(len(row)) - np.repeat(pieces.cumsum() - pieces, pieces)
+    hour = first[row] + offset
+    after = np.maximum(start[row], hour * HOUR)
+    inside = np.minimum(end[row], (hour + 1) * HOUR) - after
+    dims = {name: as_dimension(events, name) for name in by}
+
+    frames = [
+        pd.DataFrame(
+            {
+                "Hour": hour,
+                **{name: values[row] for name, values in dims.items()},
+                "Seconds": np.maximum(inside, 0) * held[row],
+            }
+        ),
+        pd.DataFrame({"Hour": first, **dims, "Duration": end - start, "Checkouts": 1}),
+    ]
+    if len(denied):
+        refused = {name: as_dimension(denied, name) for name in by}
+        hour = epoch_seconds(denied.index) // HOUR
+        frames.append(pd.DataFrame({"Hour": hour, **refused, "Denials": 1}))
+    table = pd.concat(frames, ignore_index=True)
+    table = table.groupby(["Hour", *by], sort=True).sum().reset_index()
+    for name in TOTALS:
+        if name not in table:
+            table[name] = 0
+    table = table.astype(CELL_TYPES)
+    for name in by:
+        table[name] = as_category(table[name])
+    return table
+
+
+def peaks(events, by, tokens=None):
+    """Most licenses in use at once each hour (Hour, By, Key, Peak): for
+    the pool (By "All") and per value of each of by but User"""
+    frames = []
+    dimensions = [name for name in by if name != "User" and name in events]
+    for name in [None, *dimensions]:
+        changes = concurrency.session_changes(
+            events, tokens, by=[name] if name else None
+        )
+        usage = concurrency.resample_usage(changes, "1h")
+        if usage.empty:
+            continue
+        # A column per value of name, or InUse for the pool
+        keys = [key[0] if isinstance(key, tuple) else key for key in usage.columns]
+        usage.columns = [str(key) if name else "All" for key in keys]
+        long = (
+            usage.rename_axis("Date")
+            .reset_index()
+            .melt(id_vars="Date", var_name="Key", value_name="Peak")
+        )
+        long = long[long.Peak > 0]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Hour": epoch_seconds(long.Date) // HOUR,
+                    "By": name or "All",
+                    "Key": long.Key.to_numpy(),
+                    "Peak": long.Peak.to_numpy(),
+                }
+            )
+        )
+    table = pd.DataFrame({"Hour": [], "By": [], "Key": [], "Peak": []})
+    if frames:
+        table = pd.concat(frames, ignore_index=True)
+    table = table.astype(PEAK_TYPES)
+    for name in ("By", "Key"):
+        table[name] = as_category(table[name])
+    return table
+
+
+class Rollup:
+    """Cells and peaks of one format's logs, see the top of the module"""
+
+    def __init__(self, fmt, by, table, peak):
+        self.format = fmt
+        self.by = list(by)
+        self.cells = table
+        self.peaks = peak
+
+    @classmethod
+    def build(cls, fmt, events, denied):
+        """Rollup of the sessions and refusals of a run, format fmt"""
+        events = fmt.sites(events.copy())
+        denied = fmt.sites(denied.copy())
+        by = list(fmt.rollup_by)
+        return cls(
+            fmt.name,
+            by,
+            cells(events, denied, by, fmt.tokens),
+            peaks(events, by, fmt.tokens),
+        )
+
+    def span(self):
+        """First and last hour with anything in it, None if empty"""
+        if self.cells.empty:
+            return None
+        return int(self.cells.Hour.min()), int(self.cells.Hour.max())
+
+    def merge(self, newer, span=None):
+        """This with the hours of span, (first, last) and by default all
+        newer has, replaced by newer's"""
+        if newer.format != self.format or newer.by != self.by:
+            raise ValueError(
+                f"Rollup is of {self.format} logs by {', '.join(self.by)}, "
+                f"not {newer.format}"
+            )
+        span = span or newer.span()
+        if span is None:
+            return self
+        first, last = span
+        kept = ~self.cells.Hour.between(first, last)
+        kept_peaks = ~self.peaks.Hour.between(first, last)
+        return Rollup(
+            self.format,
+            self.by,
+            concat_records([self.cells[kept], newer.cells]),
+            concat_records([self.peaks[kept_peaks], newer.peaks]),
+        )
+
+    def window(self, start=None, end=None):
+        """Rollup of the hours start to end overlaps, both optional"""
+        return self.hours(hour_of(start), hour_of(end, last=True))
+
+    def hours(self, first=None, last=None):
+        """Rollup of hours first to last (since 1970), both optional"""
+        table, peak = self.cells, self.peaks
+        if first is not None:
+            table, peak = table[table.Hour >= first], peak[peak.Hour >= first]
+        if last is not None:
+            table, peak = table[table.Hour <= last], peak[peak.Hour <= last]
+        return Rollup(self.format, self.by, table, peak)
+
+    def sessions(self):
+        """Cells with checkouts, Duration as a timedelta and Date the hour,
+        shaped enough like an events table for the reports"""
+        table = self.cells[self.cells.Checkouts > 0].copy()
+        table["Duration"] = pd.to_timedelta(table.Duration, unit="s")
+        table.insert(0, "Date", pd.to_datetime(table.Hour * HOUR, unit="s"))
+        return table
+
+    def totals(self, by):
+        """TOTALS of the window grouped by, times as timedeltas"""
+        table = self.cells.groupby(by, observed=True)[TOTALS].sum()
+        for name in ("Seconds", "Duration"):
+            table[name] = pd.to_timedelta(table[name], unit="s")
+        return table
+
+    def peak(self, by="All"):
+        """Most in use at once in the window, per value of by"""
+        peak = self.peaks[self.peaks.By == by]
+        return peak.groupby("Key", observed=True)["Peak"].max()
+
+    def save(self, directory):
+        """Write to directory, replacing what was there"""
+        meta = {
+            "format": self.format,
+            "by": self.by,
+            "saved": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        for name, table in (("cells", self.cells), ("peaks", self.peaks)):
+            logcache.save(os.path.join(directory, f"{name}.npz"), table, meta, True)
+
+    @classmethod
+    def load(cls, directory):
+        """Rollup saved in directory, None if there isn't one"""
+        table, meta = logcache.load(os.path.join(directory, "cells.npz"))
+        peak, _ = logcache.load(os.path.join(directory, "peaks.npz"))
+        if table is None or peak is None:
+            return None
+        return cls(meta["format"], meta["by"], table, peak)
+
+
+def hour_of(when, last=False):
+    """Hours since 1970 of a --start/--end string, None for None
+    last: the hour when falls in, unless it is on the hour"""
+    if not when:
+        return None
+    seconds = int(pd.Timestamp(when).timestamp())
+    if last:
+        # 14:00 is the end of the 13:00 hour
+        return (seconds - 1) // HOUR
+    return seconds // HOUR
+
+
+def whole_hours(fmt, span, start=None, end=None):
+    """Hours of span (first, last) a run of the --start/--end window has
+    all of. It misses the sessions checked out before start, taken to last
+    no longer than the format's overrun, and everything checked out after
+    end. None if there are none"""
+    first, last = span
+    if start:
+        # The first hour after the overrun, unless it ends on the hour
+        first = max(first, hour_of(pd.Timestamp(start) + fmt.overrun, last=True) + 1)
+    if end:
+        # Before the hour end falls in
+        last = min(last, hour_of(end) - 1)
+    return (first, last) if first <= last else None
+
+
+def update(directory, fmt, events, denied, start=None, end=None):
+    """Add the sessions and refusals of a run to the rollup in directory
+    start, end: the run's window, only the hours it has whole are replaced
+    Return the rollup as saved"""
+    newer = Rollup.build(fmt, events, denied)
+    span = newer.span()
+    if span and (start or end):
+        span = whole_hours(fmt, span, start, end)
+        if span is None:
+            print("==No whole hours in the window, rollup left as it was==")
+            return Rollup.load(directory)
+        newer = newer.hours(*span)
+    older = Rollup.load(directory)
+    rollup = newer if older is None else older.merge(newer, span)
+    rollup.save(directory)
+    return rollup
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Sparse time index of a log: byte offsets of lines in it and the date
+   and time on them, so a --start/--end window parses only its part of
+   the log instead of years of it.
+   lmgrd logs are indexed at their TIMESTAMP lines, the only lines with a
+   date, and parsing starts at one with its date. Logs with a date on
+   every line (stardrop, cresset) at the first line every INDEX_SPACING
+   bytes. The format says how, see LogFormat.index_marker and line_date
+
+   Kept in the cache directory as JSON and brought up to date by scanning
+   only what was appended since, like the parse cache; a rotated or
+   truncated log is indexed again. With no index the start of a window
+   up to now (--dur alone) is found scanning back from the end instead,
+   nothing written"""
+import os
+import mmap
+import json
+import bisect
+import hashlib
+import datetime
+import tempfile
+import logcache
+
+# Bump when the stored layout changes
+INDEX_VERSION = 1
+# Bytes between the lines indexed of logs with a date on every line
+INDEX_SPACING = 1 << 20
+# Bytes read at a time scanning back from the end
+SCAN_BLOCK = 1 << 20
+
+
+def index_path(filename, tag):
+    """Index file of this log, for the format (tag) reading it"""
+    key = json.dumps([INDEX_VERSION, os.path.realpath(filename), tag])
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(logcache.cache_dir(), f"{digest}.index.json")
+
+
+def load(path):
+    """Stored index, None if there is no usable one"""
+    try:
+        with open(path, encoding="utf8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save(path, meta):
+    """Write index to path, atomically replacing the old one"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            json.dump(meta, f)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def scan(fmt, mm, start, end, **kwargs):
+    """Index entries [offset, ISO datetime] of whole lines in mm[start:end]"""
+    entries = []
+    if fmt.index_marker:
+        # Every line with the marker
+        found = mm.find(fmt.index_marker, start, end)
+        while found >= 0:
+            begin = mm.rfind(b"\n", start, found) + 1 or start
+            stop = mm.find(b"\n", found, end)
+            if stop < 0:
+                break
+            line = mm[begin:stop].decode("utf-8", errors="ignore")
+            when = fmt.line_date(line, **kwargs)
+            if when is not None:
+                entries.append([begin, when.isoformat()])
+            found = mm.find(fmt.index_marker, stop, end)
+        return entries
+
+    # First dated line every INDEX_SPACING bytes
+    mark = start
+    while mark < end:
+        if mark and mm[mark - 1] != ord("\n"):
+            # On to the start of the next line
+            mark = mm.find(b"\n", mark, end) + 1 or end
+        begin = mark
+        while begin < end:
+            stop = mm.find(b"\n", begin, end)
+            when = fmt.line_date(mm[begin:stop].decode("utf-8", "ignore"), **kwargs)
+            if when is not None:
+                entries.append([begin, when.isoformat()])
+                break
+            begin = stop + 1
+        mark = begin + INDEX_SPACING
+    return entries
+
+
+def update(fmt, **kwargs):
+    """Index of the log, scanning only what was added since it was
+    saved. Return its entries, [offset, ISO datetime] in file order"""
+    filename = kwargs["filename"]
+    path = index_path(filename, fmt.cache_tag(**kwargs))
+    meta = load(path)
+    stat = os.stat(filename)
+    if not stat.st_size:
+        return []
+    with open(filename, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        if meta is not None and not logcache.still_valid(f, stat, meta):
+            meta = None
+        if meta is not None and meta["offset"] == stat.st_size:
+            return meta["entries"]
+        start = meta["offset"] if meta else 0
+        # Whole lines only, one still being written is for next time
+        end = mm.rfind(b"\n", start) + 1 or start
+        entries = meta["entries"] if meta else []
+        if entries and not fmt.index_marker:
+            # Spaced on from the last line indexed, as if it were done in one go
+            start = max(start, entries[-1][0] + INDEX_SPACING)
+        entries += scan(fmt, mm, start, end, **kwargs)
+        meta = {
+            "device": stat.st_dev,
+            "inode": stat.st_ino,
+            "offset": end,
+            "fingerprint": logcache.fingerprint(f, end),
+            "entries": entries,
+        }
+    save(path, meta)
+    return entries
+
+
+def scan_back(fmt, start, **kwargs):
+    """Offset and date of the last indexable line before start, found
+    reading back from the end of the log. (0, None) if there isn't one"""
+    with open(kwargs["filename"], "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        end = len(mm)
+        while end > 0:
+            begin = mm.rfind(b"\n", 0, max(end - SCAN_BLOCK, 0)) + 1
+            lines = mm[begin:end].split(b"\n")
+            offset = end
+            for line in reversed(lines):
+                offset -= len(line) + 1
+                if fmt.index_marker and fmt.index_marker not in line:
+                    continue
+                when = fmt.line_date(line.decode("utf-8", "ignore"), **kwargs)
+                if when is not None and when < start:
+                    return offset + 1, when
+            end = begin
+    return 0, None
+
+
+def byte_range(fmt, start, end, recent=False, **kwargs):
+    """Bytes of the log to parse for records start to end, from its index
+    recent: the window runs up to now, with no index scan back from the
+    end for its start rather than index the whole log
+    Return (first, last, date there or None)"""
+    filename = kwargs["filename"]
+    path = index_path(filename, fmt.cache_tag(**kwargs))
+    size = os.path.getsize(filename)
+    if recent and load(path) is None:
+        first, when = scan_back(fmt, start, **kwargs)
+        return first, size, when
+
+    entries = update(fmt, **kwargs)
+    dates = [datetime.datetime.fromisoformat(when) for _, when in entries]
+    if any(b < a for a, b in zip(dates, dates[1:])):
+        # Out of order, e.g. a new year in a log without years: read it all
+        return 0, size, None
+    # The last indexed line before start: nothing before it is in the window
+    before = bisect.bisect_left(dates, start) - 1
+    first, when = (entries[before][0], dates[before]) if before >= 0 else (0, None)
+    # Nor after the first one past end
+    after = bisect.bisect_right(dates, end)
+    last = entries[after][0] if after < len(entries) else size
+    return first, max(last, first), when
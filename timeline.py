@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Draw the session timeline of every graph() in a time that doesn't grow
+   with the length of the log.
+   Sessions are one batched LineCollection, a row per user. Past a few
+   tens of thousands of sessions each user's sessions are summed into
+   time buckets and drawn as one image whose alpha is the share of the
+   bucket they had a license: occupancy still shows, memory stays at
+   rows x buckets. Many users are split into pages
+   by site, the loans panel is cut to the min and max of each bucket"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+from matplotlib.dates import date2num
+import concurrency
+
+# More sessions than this and we draw occupancy
+MAX_SEGMENTS = 50_000
+# Buckets across the chart, about one per pixel
+BUCKETS = 2000
+# Users per page
+MAX_ROWS = 80
+# Bucket sizes we choose from for occupancy
+FREQUENCIES = ["1min", "5min", "15min", "30min", "1h", "3h", "6h", "12h", "1D"]
+
+
+def headless():
+    """No display to show a window on: cron, ssh"""
+    return sys.platform.startswith("linux") and not (
+        os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")
+    )
+
+
+def pyplot():
+    """matplotlib.pyplot, only imported once there is a graph to draw
+    With no display it's on Agg rather than trying every GUI it knows"""
+    if "matplotlib.pyplot" not in sys.modules and not os.environ.get("MPLBACKEND"):
+        if headless():
+            import matplotlib
+
+            matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def user_rows(events, denied=None):
+    """Users in the order they first appear (as a categorical hlines axis
+    would have them), then any only seen in denied"""
+    users = [events["User"].astype(object)]
+    if denied is not None:
+        users.append(denied["User"].astype(object))
+    return pd.Index(pd.unique(pd.concat(users, ignore_index=True)))
+
+
+def session_colors(events, color_by, color_map):
+    """Return RGBA palette and the palette index of each session's
+    color_by in color_map. Anything not in color_map is grey (-1)"""
+    keys = [str(key) for key in color_map]
+    palette = np.array([to_rgba(color) for color in color_map.values()])
+    palette = np.vstack([palette, [[0.5, 0.5, 0.5, 1.0]]])
+    codes = pd.Categorical(events[color_by].astype(str), categories=keys).codes
+    return palette, codes
+
+
+def to_rgba(color):
+    """Palette entry as RGBA"""
+    color = tuple(color)
+    return color if len(color) == 4 else (*color, 1.0)
+
+
+def draw_timeline(ax, events, color_by, color_map, denied=None, marker="rx", **kwargs):
+    """Draw events (LicOut, LicIn, User, color_by) as a row per user on ax,
+    and denied (Date, User) with marker. Sessions are drawn one by one
+    while that is readable, else as occupancy per time bucket
+    kwargs go to the LineCollection (linewidth, alpha)"""
+    rows = user_rows(events, denied)
+    row = rows.get_indexer(events["User"].astype(object))
+    start = date2num(concurrency.as_datetimes(events["LicOut"]))
+    end = date2num(concurrency.as_datetimes(events["LicIn"]))
+    palette, codes = session_colors(events, color_by, color_map)
+
+    if len(events) > MAX_SEGMENTS:
+        span = pd.Timedelta(days=float(end.max() - start.min()))
+        draw_occupancy(ax, events, rows, row, palette, codes, span)
+    else:
+        # A path per colour, its sessions split by NaN: a few paths to
+        # draw however many sessions, not one each
+        colors = np.unique(codes)
+        paths = []
+        for code in colors:
+            mine = codes == code
+            points = np.full((mine.sum(), 3, 2), np.nan)
+            points[:, 0, 0], points[:, 1, 0] = start[mine], end[mine]
+            points[:, :2, 1] = row[mine, None]
+            paths.append(points.reshape(-1, 2))
+        ax.add_collection(LineCollection(paths, colors=palette[colors], **kwargs))
+        if len(events):
+            ax.set_xlim(start.min(), end.max())
+
+    if denied is not None and len(denied):
+        ax.plot(
+            date2num(concurrency.as_datetimes(denied["Date"])),
+            rows.get_indexer(denied["User"].astype(object)),
+            marker,
+        )
+    ax.set_yticks(np.arange(len(rows)))
+    ax.set_yticklabels(rows)
+    ax.set_ylim(-1, len(rows))
+
+
+def bucket_size(span, buckets=BUCKETS):
+    """Smallest of FREQUENCIES giving no more than buckets over span"""
+    for freq in FREQUENCIES:
+        if span / pd.Timedelta(freq) <= buckets:
+            return freq
+    return FREQUENCIES[-1]
+
+
+def draw_occupancy(ax, events, rows, row, palette, codes, span):
+    """Each user's share of every time bucket with a license out, as one
+    image coloured by the user's most common colour"""
+    freq = bucket_size(span)
+    first, usage = occupancy(events, rows, freq)
+    # Any use at all stays visible, a full bucket is opaque
+    shade = np.clip(usage, 0, 1)
+    shade = np.where(shade > 0, 0.2 + 0.8 * shade, 0)
+
+    colors = palette[row_codes(len(rows), row, codes)]
+    image = np.empty((len(rows), usage.shape[1], 4))
+    image[:, :, :3] = colors[:, None, :3]
+    image[:, :, 3] = shade
+    left = date2num(first.to_pydatetime())
+    right = left + usage.shape[1] * pd.Timedelta(freq) / pd.Timedelta(days=1)
+    ax.imshow(
+        image,
+        aspect="auto",
+        interpolation="nearest",
+        origin="lower",
+        extent=(left, right, -0.5, len(rows) - 0.5),
+    )
+    ax.set_xlim(left, right)
+
+
+def occupancy(events, rows, freq):
+    """Time weighted sessions open of each user in rows per period of freq
+    Return the start of the first period and a rows x periods array"""
+    changes = concurrency.session_changes(events, by=["User"])
+    changes["User"] = changes["User"].astype(object)
+    usage = concurrency.resample_usage(changes, freq, "mean")
+    usage.columns = usage.columns.get_level_values("User")
+    return usage.index[0], usage.T.reindex(rows).fillna(0).to_numpy()
+
+
+def row_codes(count, row, codes):
+    """Palette index of each of count rows: the most common of the codes
+    of its sessions, grey (-1) for rows without any"""
+    pairs = pd.DataFrame({"row": row, "code": codes})
+    common = pairs.groupby(["row", "code"]).size().sort_values(kind="stable")
+    common = common.reset_index().drop_duplicates("row", keep="last")
+    result = np.full(count, -1, dtype=np.int64)
+    result[common["row"].to_numpy()] = common["code"].to_numpy()
+    return result
+
+
+def downsample(loans, buckets=BUCKETS):
+    """Keep the first, last, min and max point of loans in each of buckets
+    time buckets, so peaks and troughs survive however long the series"""
+    if len(loans) <= 4 * buckets:
+        return loans
+    when = concurrency.as_datetimes(loans.index).astype(np.int64)
+    edges = np.linspace(when[0], when[-1], buckets + 1)
+    bucket = np.clip(np.searchsorted(edges, when, "right") - 1, 0, buckets - 1)
+    values = pd.Series(loans.to_numpy())
+    grouped = values.groupby(bucket)
+    keep = np.concatenate(
+        [
+            grouped.idxmin().to_numpy(),
+            grouped.idxmax().to_numpy(),
+            grouped.head(1).index.to_numpy(),
+            grouped.tail(1).index.to_numpy(),
+        ]
+    )
+    return loans.iloc[np.unique(keep)]
+
+
+def pages(events, facet=None, rows=MAX_ROWS):
+    """Split events into pages of no more than rows users, by facet
+    (e.g. site) first when there are too many for one.
+    Yield (name, events) pairs, name "" when one page will do"""
+    if events["User"].nunique() <= rows:
+        yield "", events
+        return
+    if facet is None:
+        groups = [("", events)]
+    else:
+        groups = events.groupby(facet, observed=True, sort=True)
+    for name, group in groups:
+        if isinstance(name, tuple):
+            name = "-".join(str(part) for part in name)
+        users = pd.unique(group["User"].astype(object))
+        for page, first in enumerate(range(0, len(users), rows)):
+            label = str(name)
+            if len(users) > rows:
+                label = "-".join(filter(None, [label, str(page + 1)]))
+            yield label, group[group["User"].isin(users[first : first + rows])]
+
+
+def page_filename(filename, name):
+    """filename of the page called name: Geneious-date-GB01.png"""
+    if not name:
+        return filename
+    base, extension = os.path.splitext(filename)
+    return f"{base}-{name}{extension}"
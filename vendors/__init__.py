@@ -0,0 +1,4 @@
+"""Log format plugins licvis reads, see vendors.base
+   Imported in the order detect() tries them: most particular first"""
+from vendors.base import FORMATS, register, get, detect, LogFormat, LmgrdFormat
+from vendors import stardrop, cresset, geneious, flexlm
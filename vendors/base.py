@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""What licvis needs to know of a vendor's log: how to tell it from the
+   others, parse it, build dates, split and pair it, and what goes in its
+   report. The pipeline itself is the same for every vendor, see licvis.py
+   A new vendor is a LogFormat subclass in its own module, @register it
+   Plotting is imported when there is a graph to draw, not before: runs
+   that only want the tables never load matplotlib or seaborn"""
+import os
+import re
+import asyncio
+import datetime
+import collections
+import lmgrd
+import follow
+import metrics
+from ingest import open_log
+
+# Characters of the log head a format is told from
+SNIFF_SIZE = 8192
+
+# Formats by name, in the order detect() tries them
+FORMATS = {}
+
+# Any lmgrd debug log line: 16:07:10 (app-name) ...
+LMGRD_LINE = re.compile(r"\s*\d+:\d\d:\d\d \([^)]*\) ")
+
+
+def register(cls):
+    """Class decorator: make cls a format licvis can read"""
+    FORMATS[cls.name] = cls()
+    return cls
+
+
+def get(name):
+    """The registered format called name"""
+    if name not in FORMATS:
+        raise ValueError(f"No log format {name}, try one of {', '.join(FORMATS)}")
+    return FORMATS[name]
+
+
+def head(filename, size=SNIFF_SIZE):
+    """Whole lines in the first size characters of filename"""
+    with open_log(filename) as f:
+        text = f.read(size)
+    lines = text.splitlines()
+    if len(text) == size and len(lines) > 1:
+        # Last one was cut short
+        lines.pop()
+    return lines
+
+
+def detect(filename):
+    """First format to claim the head of filename"""
+    try:
+        lines = head(filename)
+    except OSError:
+        lines = []
+    for fmt in FORMATS.values():
+        if fmt.sniff(lines):
+            return fmt
+    raise ValueError(f"Can't tell what {filename} is, give --format")
+
+
+class LogFormat:
+    """A vendor's log. Class attributes describe it, override the methods
+    where it is different"""
+
+    name = ""  # --format and the cache tag
+    columns = []  # Fields of each record log_parse yields
+    dtypes = {}
+    discard = []  # Columns dropped once Date is built
+    keys = ["User"]  # A checkin closes the checkouts with the same keys
+    sessions = []  # Events table columns
+    checkout = ("OUT:",)
+    checkin = ("IN:",)
+    denied = ("DENIED:",)
+    # Look forward beyond the slice to find session ends
+    overrun = datetime.timedelta(hours=12)
+    tokens = None  # Column of licenses each checkout takes, if not one
+    show = False  # Show the graph in a window rather than save it
+    rollup_by = ["User"]  # Rollup cells are an hour of each of these, see rollup.py
+    index_marker = None  # Time index the lines with this in, else every so often
+
+    # Report outputs
+    prefix = ""  # flexlm-date.png
+    title = ""
+    color_by = "Module"
+    palette = "Paired"
+    facet = None  # Too many users for a page: split by this first
+    figsize = (16, 10)
+    marker = "kx"
+    line = {"linewidth": 6}
+    loans_axis = {}  # ax.set() of the loans panel under the timeline
+
+    def sniff(self, lines):
+        """Is this head of a log ours"""
+        raise NotImplementedError
+
+    def log_parse(self, lines, state=None, **kwargs):
+        """Yield the records of lines we're interested in"""
+        raise NotImplementedError
+
+    def cache_tag(self, **kwargs):
+        """Tells our cached parses from those of other formats"""
+        return self.name
+
+    def line_date(self, line, **kwargs):
+        """datetime of a line of the log for the time index, None if it
+        hasn't got one. See timeindex.py"""
+        return None
+
+    def dates(self, df, **kwargs):
+        """Build the Date column of the parsed records"""
+        return df
+
+    def library(self, df_sub):
+        """Take anything that isn't a session out of df_sub
+        Return df_sub and the loans step series to graph, or None"""
+        return df_sub, None
+
+    def sites(self, frame):
+        """frame with Host the site it is at, for formats that have one"""
+        return frame
+
+    def tables(self, events, df_sub_ref, opt, loans=None):
+        """Print and write the tables of the report
+        Return events and loans as the graph should have them"""
+        return events, loans
+
+    def rollup_tables(self, rollup, opt):
+        """Tables of the report from the rollup of a window, see rollup.py
+        Totals and the most in use at once by each of rollup_by but User"""
+        for by in [name for name in self.rollup_by if name != "User"] or ["User"]:
+            print(f"==Checkouts, duration and refusals by {by}==")
+            print(rollup.totals([by]).sort_values("Duration", ascending=False))
+            if by != "User":
+                print(f"==Most licenses in use at once by {by}==")
+                print(rollup.peak(by).sort_values(ascending=False).to_string())
+        print(f"==Most licenses in use at once: {rollup.peak().max()}==")
+
+    def save(self, frame, filename, opt, **kwargs):
+        """frame.to_csv or to_excel as filename, if that kind of file is in
+        --outputs. kwargs go to pandas"""
+        kind = os.path.splitext(filename)[1][1:]
+        if kind not in opt.outputs:
+            return
+        with metrics.stage("export"):
+            if kind == "xlsx":
+                frame.to_excel(filename, **kwargs)
+            else:
+                frame.to_csv(filename, **kwargs)
+
+    def report(self, events, df_sub_ref, opt, loans=None, show=False):
+        """Tables, CSVs and graph for the sessions in events, options in opt"""
+        with metrics.stage("aggregate"):
+            events, loans = self.tables(events, df_sub_ref, opt, loans)
+
+        if "html" in opt.outputs:
+            import explorer
+
+            # Every zoom level in one page, no rerun to look closer
+            with metrics.stage("render"):
+                explorer.write_explorer(
+                    events,
+                    f"{self.prefix}-explorer.html",
+                    self.color_by,
+                    denied=df_sub_ref,
+                    tokens=self.tokens,
+                    title=self.title,
+                )
+
+        if "png" in opt.outputs:
+            with metrics.stage("render"):
+                self.graph(events, df_sub_ref, loans, show)
+
+    def graph(self, events, df_sub_ref, loans=None, show=False):
+        """Draw graph of license use duration per user on timeline
+        plot time license unavailable as x, loans underneath if we have
+        them. Too many users for one chart and they are split over pages
+        show: in a window, if there's a display, else saved"""
+        import seaborn as sns
+        import timeline
+
+        plt = timeline.pyplot()
+        show = show and not timeline.headless()
+        color_labels = events[self.color_by].unique()
+        rgb_values = sns.color_palette(self.palette, len(color_labels))
+        color_map = dict(zip(color_labels, rgb_values))
+        if loans is not None:
+            loans = timeline.downsample(loans)
+        for name, sessions in timeline.pages(events, self.facet):
+            denied = df_sub_ref
+            if name:
+                denied = df_sub_ref[df_sub_ref.User.isin(sessions.User)]
+            fig = plt.figure(figsize=self.figsize)
+            if loans is None:
+                ax = fig.add_subplot()
+            else:
+                ax = plt.subplot2grid((6, 1), (0, 0), rowspan=5, fig=fig)
+                panel = plt.subplot2grid((6, 1), (5, 0), sharex=ax, fig=fig)
+            ax.grid(which="major", axis="x")
+            ax.tick_params(axis="both", which="major", labelsize=6)
+            ax.tick_params(axis="both", which="minor", labelsize=6)
+            ax.set_ylabel("Users", color="tab:blue")
+            ax.spines["right"].set_position(("axes", 1))
+            ax.xaxis_date()
+            patches = [
+                ax.plot(
+                    [],
+                    [],
+                    marker="o",
+                    ms=10,
+                    ls="",
+                    mec=None,
+                    color=rgb_values[i],
+                    label=str(color_labels[i]),
+                )[0]
+                for i in range(len(color_labels))
+            ]
+            ax.legend(handles=patches, bbox_to_anchor=(0, 1), loc="upper left")
+            timeline.draw_timeline(
+                ax, sessions, self.color_by, color_map, denied, self.marker, **self.line
+            )
+
+            if loans is not None:
+                panel.set(**self.loans_axis)
+                panel.grid(which="major", axis="x", alpha=0.5)
+                loans.plot(
+                    ax=panel,
+                    color="tab:green",
+                    linewidth=1,
+                    grid=True,
+                    drawstyle="steps-post",
+                )
+            fig.autofmt_xdate()
+            fig.tight_layout()
+            if show:
+                plt.show()
+            else:
+                fig.savefig(timeline.page_filename(f"{self.prefix}-date.png", name))
+            plt.close(fig)
+
+    def follow_logs(self, filenames, interval, opt, **kwargs):
+        """Tail the logs, snapshot outputs every interval seconds"""
+        raise ValueError(f"--follow isn't there for {self.name} logs yet")
+
+
+class LmgrdFormat(LogFormat):
+    """lmgrd (Flexlm) debug log, see lmgrd.py. Times of day under the date
+    of the last TIMESTAMP line"""
+
+    product = None  # Only keep lines of this vendor daemon, e.g. "(geneious)"
+    index_marker = b" TIMESTAMP "
+    columns = ["Stamp", "Seconds", "Product", "Action", "Module", "User", "Host"]
+    # Dictionary encode the strings as we go, compact integers
+    dtypes = {
+        "Stamp": "int32",
+        "Seconds": "int32",
+        "Product": "category",
+        "Action": "category",
+        "Module": "category",
+        "User": "category",
+        "Host": "category",
+    }
+
+    def sniff(self, lines):
+        return any(
+            LMGRD_LINE.match(line) and (self.product is None or self.product in line)
+            for line in lines
+        )
+
+    def log_parse(self, lines, state=None, **kwargs):
+        """Take logfile and add date to every time.
+        Keep only the events we're interested in"""
+        if state and state.get("date"):
+            # Carry on from the date a cached parse had reached
+            current_date = datetime.date.fromisoformat(state["date"])
+        elif kwargs.get("rotated"):
+            # One of several logs, until its first TIMESTAMP the date is where
+            # the log before got to: lmgrd.fill_unknown_stamps sorts it out
+            current_date = None
+        else:
+            current_date = self.first_date(**kwargs)
+
+        yield from lmgrd.parse_events(
+            lines,
+            current_date,
+            product=self.product,
+            tokens=self.tokens is not None,
+            state=state,
+        )
+
+    def first_date(self, **kwargs):
+        """Date to give the log before its first TIMESTAMP"""
+        if kwargs.get("hint"):
+            return datetime.date.fromisoformat(kwargs.get("hint"))
+        # Kludge we should only start at first TIMESTAMP unless we use a --hint
+        return datetime.date(2019, 1, 1)
+
+    def cache_tag(self, **kwargs):
+        return f"{self.name} {kwargs.get('hint')}"
+
+    def line_date(self, line, **kwargs):
+        """Date and time of a TIMESTAMP line the parser would take"""
+        match = lmgrd.TIMESTAMP_LINE.match(line)
+        if match is None:
+            return None
+        prod, month, day, year = match.groups()
+        if self.product and prod != self.product:
+            return None
+        clock = datetime.time.fromisoformat(line.split()[0].zfill(8))
+        return datetime.datetime.combine(
+            datetime.date(int(year), int(month), int(day)), clock
+        )
+
+    def dates(self, df, **kwargs):
+        df["Stamp"] = lmgrd.fill_unknown_stamps(df["Stamp"], self.first_date(**kwargs))
+        # Rebuild full dates in bulk, fixing midnight rollovers
+        dates, rollovers = lmgrd.rebuild_dates(df["Stamp"], df["Seconds"])
+        metrics.count("rollovers_fixed", rollovers)
+        if rollovers:
+            print(f"AWOOGA!!! ALERT {rollovers} pumpkins. Fixed rollover dates")
+        df.insert(0, "Date", dates)
+        return df
+
+    def on_record(self, table, when, record):
+        """Put a record of a followed log in table"""
+        raise NotImplementedError
+
+    def snapshot(self, table, opt):
+        """Write out what table has so far, the --outputs in opt"""
+        raise NotImplementedError
+
+    def follow_logs(self, filenames, interval, opt, **kwargs):
+        """Tail the logs, keeping open sessions and licenses in use current
+        Snapshot outputs every interval seconds"""
+        table = follow.SessionTable()
+        dates = collections.defaultdict(lmgrd.DateRebuilder)
+
+        def on_record(filename, record):
+            stamp, seconds = record[:2]
+            self.on_record(table, dates[filename](stamp, seconds), record)
+
+        try:
+            asyncio.run(
+                follow.follow(
+                    filenames,
+                    lambda lines, state: self.log_parse(lines, state=state, **kwargs),
+                    on_record,
+                    lambda: self.snapshot(table, opt),
+                    interval,
+                )
+            )
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Cresset log: lmgrd like lines with the month and day but no year
+
+   03/01 00:35:58 (cresset) OUT: ANVIL 1.1 by user25@GB25PC175.corp.com
+"""
+import re
+import datetime
+import pandas as pd
+import capacity
+from vendors.base import LogFormat, register
+
+# MM/DD HH:MM:SS (product)
+CRESSET_LINE = re.compile(r"\d+/\d+ \d+:\d\d:\d\d \([^)]*\) ")
+
+
+@register
+class Cresset(LogFormat):
+    name = "cresset"
+    columns = [
+        "Date",
+        "Time",
+        "Product",
+        "Action",
+        "Module",
+        "Version",
+        "prep",
+        "User@Host",
+    ]
+    # Dictionary encode the strings as we go
+    dtypes = {
+        "Date": "category",
+        "Product": "category",
+        "Action": "category",
+        "Module": "category",
+        "Version": "category",
+        "prep": "category",
+        "User@Host": "category",
+    }
+    discard = ["Time", "Product", "prep", "User@Host"]
+    keys = ["User", "Module"]
+    sessions = ["LicOut", "LicIn", "Module", "Version", "Duration", "User", "Host"]
+    rollup_by = ["User", "Module", "Version", "Host"]
+
+    prefix = "Cresset"
+    title = "Cresset"
+    facet = "Host"
+    line = {"linewidth": 6, "alpha": 0.8}
+
+    def sniff(self, lines):
+        return any(CRESSET_LINE.match(line) for line in lines)
+
+    def log_parse(self, lines, state=None, **kwargs):
+        """Take logfile and add date to every time.
+        Keep only the events we're interested in"""
+        grabbag = ["IN:", "OUT:"]
+        for line in lines:
+            line = line.replace("(client exit) ", "")
+            data = line.split()
+            if len(data) < 4:
+                continue
+
+            if [i for i in grabbag if i in data[3]]:
+                yield data
+            else:
+                continue
+
+    def line_date(self, line, **kwargs):
+        if not CRESSET_LINE.match(line):
+            return None
+        year = (kwargs.get("hint") or "2021")[:4]
+        return datetime.datetime.strptime(f"{year}/{line[:14]}", "%Y/%m/%d %H:%M:%S")
+
+    def dates(self, df, **kwargs):
+        # fix quirks: no year in the log, --hint gives it
+        year = (kwargs.get("hint") or "2021")[:4]
+        df.Date = f"{year}/" + df.Date.astype(str)
+        df[["User", "Host"]] = df["User@Host"].str.split("@", n=1, expand=True)
+        df = df.astype({"User": "category", "Host": "category"})
+        df["Date"] = pd.to_datetime(df["Date"] + " " + df["Time"])
+        return df
+
+    def sites(self, frame):
+        if "Host" in frame:
+            # Truncate Host to 4 chars making them CAPS
+            frame.Host = frame.Host.str.slice(0, 4)
+            frame.Host = frame.Host.str.upper()
+        return frame
+
+    def tables(self, events, df_sub_ref, opt, loans=None):
+        if opt.capacity:
+            # How close each module came to the pool limit
+            capacity.write_capacity(
+                events, "Cresset", self, opt, by=["Module"], seats=opt.seats
+            )
+
+        events = self.sites(events)
+
+        # Sort by Site (else graph is by login time)
+        events.sort_values(by=["Host"], inplace=True)
+        self.site_users(events, opt)
+
+        # Checkouts per module and duration
+        print("==Sum of Checkouts total duration per module==")
+        print(
+            events.groupby(["Module", "Version"], observed=True)["Duration"]
+            .agg(["sum", "count"])
+            .sort_values(["sum"], ascending=False)
+        )
+        self.module_users(events, opt)
+        return events, loans
+
+    def rollup_tables(self, rollup, opt):
+        super().rollup_tables(rollup, opt)
+        sessions = rollup.sessions()
+        self.site_users(sessions, opt)
+        self.module_users(sessions, opt)
+
+    def site_users(self, events, opt):
+        """Top users by site and the number at each, of events or of the
+        sessions of a rollup"""
+        # Output CSV of top users by site
+        print("==Top users checkout duration by Site==")
+        print('--Output as CSV file "Cresset-siteusers.csv"--')
+        df_agg = (
+            events[["User", "Duration", "Host"]]
+            .groupby(["Host", "User"], observed=True)["Duration"]
+            .agg(["sum"])
+            .sort_values(["sum"], ascending=False)
+        )
+        df_agg.columns = df_agg.columns.str.strip()
+        df_agg = df_agg.sort_values(by=["Host", "sum"], ascending=False)
+        self.save(df_agg, "Cresset-siteusers.csv", opt, encoding="utf8")
+
+        print("==Number of users by site==")
+        print(
+            events.groupby("Host", observed=True)["User"]
+            .nunique()
+            .sort_values(ascending=False)
+            .to_string()
+        )
+
+    def module_users(self, events, opt):
+        """Users of each module version, of events or of the sessions of a
+        rollup"""
+        print("==Module and Module version use profile (users of modules)==")
+        print('--Output as Excel file "Cresset-modules.xlsx"--')
+        df_modules = (
+            events[["User", "Duration", "Module", "Version"]]
+            .groupby(["Module", "Version"], observed=True)["User"]
+            .unique()
+        )
+        pd.set_option("display.max_colwidth", None)
+        self.save(df_modules, "Cresset-modules.xlsx", opt)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Flexlm token suite log: modules checked out by users take tokens from
+   a SUITE_ library, the library's own checkouts say how many
+
+   15:06:29 (ACME) OUT: "ROCK_KIT" wcyote@GBAZL5CG8343SD5
+   15:06:29 (ACME) OUT: "SUITE_ROAD_RUNNER" wcyote@GBAZL5CG8343SD5  (4 licenses)
+"""
+import concurrency
+import capacity
+from denials import denial_context
+from vendors.base import LmgrdFormat, register
+
+
+@register
+class Flexlm(LmgrdFormat):
+    """Any lmgrd log the more particular formats before us don't claim"""
+
+    name = "flexlm"
+    columns = LmgrdFormat.columns + ["Tokens"]
+    dtypes = {**LmgrdFormat.dtypes, "Tokens": "int16"}
+    discard = ["Stamp", "Seconds", "Product", "Host"]
+    keys = ["User", "Module"]
+    sessions = ["LicOut", "LicIn", "Module", "Duration", "User", "Tokens"]
+    tokens = "Tokens"
+    show = True
+    rollup_by = ["User", "Module"]
+
+    prefix = "flexlm"
+    title = "flexlm"
+    palette = "hls"
+    loans_axis = {"ylim": (0, 80), "ylabel": "Token Library"}
+
+    def library(self, df_sub):
+        print(df_sub["Tokens"])
+        # Make collection of token library
+        token_tally = df_sub[df_sub["Module"].str.contains("SUITE_")]
+        # Now purge it from our data
+        df_sub = df_sub[~df_sub.Module.str.contains('"SUITE_')]
+
+        # Token library in use: exact level at every checkout and checkin
+        library = token_tally[token_tally.Action.isin(["OUT:", "IN:"])]
+        held = library.Tokens.where(library.Action == "OUT:", -library.Tokens)
+        loans = concurrency.usage_series(concurrency.change_points(library.Date, held))
+        print(token_tally)
+        print(loans)
+        return df_sub, loans
+
+    def tables(self, events, df_sub_ref, opt, loans=None):
+        # Checkouts per module and duration
+        print(
+            events.groupby(["Module"], observed=True)["Duration"]
+            .agg(["sum", "count"])
+            .sort_values(["sum"], ascending=False)
+        )
+        self.save(events, "flexlm-events.csv", opt)
+
+        # Who held the licenses at each refusal
+        print('==Sessions open at each denial== output as "flexlm-denials.csv"')
+        denied = denial_context(df_sub_ref, events, by=["Module"], tokens="Tokens")
+        self.save(denied, "flexlm-denials.csv", opt, index=False)
+
+        if opt.capacity:
+            # How close each module came to the pool limit
+            capacity.write_capacity(
+                events,
+                "flexlm",
+                self,
+                opt,
+                by=["Module"],
+                tokens="Tokens",
+                seats=opt.seats,
+            )
+
+        self.module_users(events, opt)
+        return events, loans
+
+    def rollup_tables(self, rollup, opt):
+        super().rollup_tables(rollup, opt)
+        self.module_users(rollup.sessions(), opt)
+
+    def module_users(self, events, opt):
+        """Top users of each module, of events or of the sessions of a rollup"""
+        # Output CSV of top users by site
+        print('==Top users checkout duration by Module== output as "flexlm-modules.csv"')
+        df_agg = (
+            events[["User", "Duration", "Module"]]
+            .groupby(["Module", "User"], observed=True)["Duration"]
+            .agg(["sum"])
+            .sort_values(["sum"], ascending=False)
+        )
+        df_agg.columns = df_agg.columns.str.strip()
+        df_agg = df_agg.sort_values(by=["Module", "sum"], ascending=False)
+        self.save(df_agg, "flexlm-modules.csv", opt, encoding="utf8")
+
+    def on_record(self, table, when, record):
+        _, _, _, action, module, user, _, tokens = record
+        if action == "OUT:":
+            table.checkout(
+                (user, module),
+                when,
+                module,
+                tokens,
+                Module=module,
+                User=user,
+                Tokens=tokens,
+            )
+        elif action == "IN:":
+            table.checkin((user, module), when)
+        elif action == "DENIED:":
+            table.deny(when, Module=module, User=user)
+
+    def snapshot(self, table, opt):
+        events = table.events(self.sessions)
+        suite = events.Module.str.contains('"SUITE_')
+        # Token library in use, as far as its sessions have closed
+        changes = concurrency.session_changes(events[suite], self.tokens)
+        loans = concurrency.usage_series(changes)
+        events = events[~suite]
+        self.save(events, "flexlm-events.csv", opt)
+        self.save(table.in_use(), "flexlm-usage.csv", opt)
+        print(f"{len(events)} sessions closed, {sum(table.sessions.values())} open")
+        if len(events) and "png" in opt.outputs:
+            self.graph(events, table.denied(["Module", "User"]), loans)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Optibrium Geneious lmgrd log: one floating license, users graphed by site
+
+   16:07:10 (geneious) OUT: "floating_license" fbloggs@gbpcx5cg90224lt
+"""
+import datetime
+import numpy as np
+import pandas as pd
+import concurrency
+import capacity
+from denials import denial_context
+from vendors.base import LmgrdFormat, register
+
+
+def hosts_to_sites(events):
+    """Replace Host with the site it is at"""
+    # Truncate Host to 4 chars making them CAPS
+    events.Host = events.Host.str.slice(0, 4)
+    events.Host = events.Host.str.upper()
+
+    # Convert Ken's machines to GBJH
+    events.replace(
+        to_replace=r"(LOVE|BUFF|SPIK)", value="GBJH", regex=True, inplace=True
+    )
+    # Convert  Shimaa Sharkawy, Rana Abdelkader Salma Yassin, Hoda Kassin to GBEX
+    events.replace(
+        to_replace=r"(SHAR|ABDE|YASS|KASS)", value="GBEX", regex=True, inplace=True
+    )
+    # Convert Workspace users to EPAM
+    events.replace(to_replace=r"DESK", value="EPAM", regex=True, inplace=True)
+    return events
+
+
+@register
+class Geneious(LmgrdFormat):
+    """lmgrd log with (geneious) lines"""
+
+    name = "geneious"
+    product = "(geneious)"
+    discard = ["Stamp", "Seconds", "Product", "Module"]
+    sessions = ["LicOut", "LicIn", "Duration", "User", "Host"]
+    rollup_by = ["User", "Host"]
+
+    prefix = "Geneious"
+    title = "Geneious"
+    color_by = "Host"
+    facet = "Host"
+    figsize = (16, 12)
+    marker = "rx"
+    loans_axis = {
+        "ylim": (0, 36),
+        "ylabel": "Licenses checked OUT",
+        "yticks": np.arange(0, 36, step=6),
+    }
+
+    def sites(self, frame):
+        return hosts_to_sites(frame)
+
+    def tables(self, events, df_sub_ref, opt, loans=None):
+        # Who held the licenses at each refusal
+        print('==Sessions open at each denial== output as "geneious-denials.csv"')
+        denied = denial_context(df_sub_ref, events)
+        self.save(denied, "geneious-denials.csv", opt, index=False)
+
+        events = self.sites(events)
+
+        # Licenses in use: exact level at every checkout and checkin
+        loans = concurrency.usage_series(concurrency.session_changes(events))
+        by_site = concurrency.session_changes(events, by=["Host"])
+        print("==Most licenses in use at once by site==")
+        print(
+            by_site.groupby("Host", observed=True)["InUse"]
+            .max()
+            .sort_values(ascending=False)
+            .to_string()
+        )
+
+        if opt.capacity:
+            # How close we came to the pool limit
+            capacity.write_capacity(events, "Geneious", self, opt, seats=opt.seats)
+
+        # Sort by Site (else graph is by login time)
+        events.sort_values(by=["Host"], inplace=True)
+
+        # Find users that forget to log out
+        lazy_logins = datetime.timedelta(hours=12)
+        users_overtime = events[events.Duration >= lazy_logins]
+        print(f"==Number of occasions users session goes over {lazy_logins} Hours==")
+        print(
+            users_overtime[["User", "Duration"]]
+            .groupby(["User"], observed=True)["Duration"]
+            .agg(["count"])
+            .sort_values(["count"], ascending=False)
+        )
+        self.site_users(events, opt)
+        return events, loans
+
+    def rollup_tables(self, rollup, opt):
+        super().rollup_tables(rollup, opt)
+        self.site_users(rollup.sessions(), opt)
+
+    def site_users(self, events, opt):
+        """Top users by site and the number at each, of events or of the
+        sessions of a rollup"""
+        # Output CSV of top users by site
+        print('==Top users checkout duration by site== output as "Geneious-siteusers.csv"')
+        df_agg = (
+            events[["User", "Duration", "Host"]]
+            .groupby(["Host", "User"], observed=True)["Duration"]
+            .agg(["sum"])
+            .sort_values(["sum"], ascending=False)
+        )
+        df_agg.columns = df_agg.columns.str.strip()
+        df_agg = df_agg.sort_values(by=["Host", "sum"], ascending=False)
+        pd.set_option("display.max_colwidth", None)
+        self.save(df_agg, "Geneious-siteusers.xlsx", opt)
+
+        print("==Number of users by site==")
+        print(
+            events.groupby("Host", observed=True)["User"]
+            .nunique()
+            .sort_values(ascending=False)
+            .to_string()
+        )
+
+    def on_record(self, table, when, record):
+        _, _, _, action, module, user, host = record
+        if action == "OUT:":
+            table.checkout((user,), when, module, User=user, Host=host)
+        elif action == "IN:":
+            table.checkin((user,), when)
+        elif action == "DENIED:":
+            table.deny(when, User=user)
+
+    def snapshot(self, table, opt):
+        events = table.events(["LicOut", "LicIn", "Duration", "User", "Host"])
+        events = hosts_to_sites(events)
+        self.save(events, "geneious-events.csv", opt, encoding="utf8")
+        self.save(table.in_use(), "geneious-usage.csv", opt)
+        print(f"{len(events)} sessions closed, {sum(table.sessions.values())} open")
+        if len(events) and "png" in opt.outputs:
+            self.graph(events, table.denied(["User"]), table.loans())
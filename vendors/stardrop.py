@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# coding: utf-8
+"""Optibrium StarDrop log: # delimited, the user after 12 chars of hash
+
+   LOG:GQAAJwAKSpot#License_granted#32#19 Nov 2018 06:46
+"""
+import re
+import datetime
+import pandas as pd
+import capacity
+from denials import denial_context
+from vendors.base import LogFormat, register
+
+# LOG:stuffffUSERNAME#Action_Type#
+STARDROP_LINE = re.compile(r"LOG:[^#]*#\w+#")
+# Time at the end of the line
+STAMP = "%d %b %Y %H:%M"
+
+
+@register
+class Stardrop(LogFormat):
+    name = "stardrop"
+    columns = ["User", "Action", "Number", "Date"]
+    # Dictionary encode the strings as we go
+    dtypes = {"User": "category", "Action": "category", "Number": "category"}
+    keys = ["User", "Number"]
+    sessions = ["LicOut", "LicIn", "Number", "Duration", "User"]
+    checkout = ("License_granted",)
+    checkin = ("License_released", "Purging_license")
+    denied = ("License_refused",)
+    rollup_by = ["User", "Number"]
+
+    prefix = "stardrop"
+    title = "StarDrop"
+    color_by = "Number"
+    palette = "bright"
+    marker = "rx"
+    line = {"linewidth": 10, "alpha": 0.8}
+
+    def sniff(self, lines):
+        return any(STARDROP_LINE.match(line) for line in lines)
+
+    def log_parse(self, lines, state=None, **kwargs):
+        """Take logfile trim off hash
+        Keep only the events we're interested in"""
+        grabbag = [
+            "License_released",
+            "License_granted",
+            "Purging_license",
+            "License_refused",
+        ]
+
+        for line in lines:
+            data = re.split("#", line.strip("\n"))
+            data[0] = data[0][12:]  # LOG:stuffffUSERNAME username occurs 12 chars
+            if len(data) > 4:  # License_granted now has  version number Remove if present
+                data.pop(2)
+
+            if [i for i in grabbag if i in data[1]]:
+                yield data
+            else:
+                continue
+
+    def line_date(self, line, **kwargs):
+        # LOG:...#19 Nov 2018 06:46
+        try:
+            return datetime.datetime.strptime(line.rsplit("#", 1)[-1].strip(), STAMP)
+        except ValueError:
+            return None
+
+    def dates(self, df, **kwargs):
+        df["Date"] = pd.to_datetime(df["Date"])
+        return df
+
+    def tables(self, events, df_sub_ref, opt, loans=None):
+        # Who held the licenses at each refusal
+        print('==Sessions open at each denial== output as "stardrop-denials.csv"')
+        denied = denial_context(df_sub_ref, events, by=["Number"])
+        self.save(denied, "stardrop-denials.csv", opt, index=False)
+        # Assign names to license features
+        feature_names = {
+            "514": "wibble",
+            "520": "munge",
+            "544": "pharg",
+            "546": "mulch",
+        }
+        events["Number"] = events["Number"].cat.rename_categories(
+            lambda number: feature_names.get(number, number)
+        )
+        if opt.capacity:
+            # How close each feature came to the pool limit
+            capacity.write_capacity(
+                events, "Stardrop", self, opt, by=["Number"], seats=opt.seats
+            )
+        return events, loans